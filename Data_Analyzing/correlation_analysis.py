@@ -3,6 +3,11 @@ import plotly.express as px
 import numpy as np
 from sklearn.feature_selection import mutual_info_regression
 from scipy.spatial.distance import correlation
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Data_Exploration.numeric_block import get_numeric_block
+from Data_Visualization.report_sinks import sink_factory
 
 class CorrelationTypes:
     def __init__(self, data, topn, target_name):
@@ -18,7 +23,7 @@ class CorrelationTypes:
         -data: the input Dataframe
         '''
          #selecting only numeric columns 
-         df = self.df.select_dtypes(include=np.number)
+         df = get_numeric_block(self.df).to_frame()
 
          #creating the correlations
          fullcorr = df.corr()
@@ -55,8 +60,7 @@ class CorrelationTypes:
         -data: the input Dataframe
         '''
          # Calculate the mean for numeric columns
-         numeric_columns =self.df.select_dtypes(include=[np.number]).columns
-         spearmancorr = self.df[numeric_columns].corr(method='spearman').dropna(how='all').dropna(axis=1,how='all')
+         spearmancorr = get_numeric_block(self.df).to_frame().corr(method='spearman').dropna(how='all').dropna(axis=1,how='all')
 
          # Calculate mutual information matrix
         #  df = self.df[numeric_columns].dropna(axis=1,how='all')
@@ -66,7 +70,7 @@ class CorrelationTypes:
         #       mi_matrixaug = None
          return  spearmancorr
 
-    def top_correlations(self):
+    def top_correlations(self, builder=None, sink=None, corr_matrix=None):
             '''
             Function to create correlation csvs
             for the top 10 important features
@@ -79,14 +83,25 @@ class CorrelationTypes:
             n: int 
                 number of top and bottom linear 
                 correlation to filter
+            builder: ReportBuilder
+                if given, the files are added to the builder
+                as jobs instead of being written here
+            sink: ReportSink
+                writer of the correlation tables, xlsx if None
+            corr_matrix: pd.DataFrame
+                precomputed correlation matrix of the data,
+                computed here if None
             Returns
             ----------
             csvs for top10 tags and self.target_name
             '''
+            if sink is None:
+                sink = sink_factory('xlsx')
+
             # Making correlations
             # filtering the top relations
             # sorting the correlations
-            allrealtions = self.df.corr()
+            allrealtions = corr_matrix if corr_matrix is not None else self.df.corr()
             toprelations = allrealtions[self.topn.columns[0]]
             tag = allrealtions[self.target_name].dropna().sort_values(ascending=False)
 
@@ -98,7 +113,12 @@ class CorrelationTypes:
             
             if ":" in self.target_name:
                 self.target_name = self.target_name.replace(":","_")
-            fig.write_html('./Data_Cleansing/'+ self.target_name +"_anomaly_report/graphics/" + self.target_name + ".html")
+            # plotly.js is written once next to the html files instead of being embedded in each of them
+            html_path = './Data_Cleansing/'+ self.target_name +"_anomaly_report/graphics/" + self.target_name + ".html"
+            if builder is not None:
+                builder.add(self.target_name + '.html', fig.write_html, html_path, include_plotlyjs='directory')
+            else:
+                fig.write_html(html_path, include_plotlyjs='directory')
             
             #merging the top corelations together
             toprelations = toprelations.to_frame()
@@ -110,4 +130,8 @@ class CorrelationTypes:
                 print(top_col)
                 if ":" in top_col:
                     top_col = top_col.replace(":", "_")
-                tagcolumncorr.to_excel('./Data_Cleansing/'+ self.target_name +'_anomaly_report/xlsx/correlations/' + top_col +' corr.xlsx')
\ No newline at end of file
+                base_path = './Data_Cleansing/'+ self.target_name +'_anomaly_report/xlsx/correlations/' + top_col +' corr'
+                if builder is not None:
+                    builder.add(sink.path(top_col + ' corr'), sink.write, tagcolumncorr, base_path)
+                else:
+                    sink.write(tagcolumncorr, base_path)
\ No newline at end of file
@@ -8,6 +8,7 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from Data_Visualization.eda import EDA_Visualization
+from Data_Exploration.numeric_block import get_numeric_block
 
 
 class FeatureSelection:
@@ -22,12 +23,13 @@ class FeatureSelection:
         self.data = data
         self.target_name = target_name
 
-    def correlation_selection(self, threshold: float=.5) -> list[str]:
+    def correlation_selection(self, threshold: float=.5, corr_matrix: pd.DataFrame = None) -> list[str]:
         '''
         feature selection based on correlation to target
 
         Parameters:
         - threshold: the threshold of correlation to be selected
+        - corr_matrix: the precomputed correlation matrix of the data, computed here if None
 
         Returns:
         - selected_feats: the columns with correlation to target greater than threshold
@@ -35,7 +37,8 @@ class FeatureSelection:
         '''
 
         # threshold being .5 comes from IES
-        corr_matrix = self.data.corr()
+        if corr_matrix is None:
+            corr_matrix = self.data.corr()
         # get columns with correlation to target greater than threshold
         target_corr = corr_matrix[self.target_name]
         target_corr_positive = target_corr[target_corr > threshold]
@@ -108,7 +111,7 @@ class FeatureSelection:
             Feature_Selector = BorutaShap(model=feature_selection_model, 
                 importance_measure='shap',  
                 classification=False)
-            df = self.data.select_dtypes(include='number')
+            df = get_numeric_block(self.data).to_frame()
             X = df.drop(self.target_name,axis=1)
             if X.isnull().values.any() == True:
                 X = X.fillna(X.mean())
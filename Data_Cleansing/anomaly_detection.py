@@ -2,9 +2,15 @@ import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from Data_Visualization.plot_types import BoxPlots
 from Data_Analyzing.correlation_analysis import CorrelationTypes
 from Data_Analyzing.feature_selection import FeatureSelection
+from Data_Exploration.numeric_block import get_numeric_block
+from Data_Visualization.report_builder import ReportBuilder
+from Data_Visualization.report_sinks import sink_factory
+from Data_Cleansing.quantile_sketch import sketch_from_source
 
 
 def create_directory_with_numbered_suffix(base_path, directory_name):
@@ -18,6 +24,103 @@ def create_directory_with_numbered_suffix(base_path, directory_name):
         return new_directory_name, new_directory_path
 
 
+def sorted_quantile(values, q):
+    '''
+    Linear quantiles of already sorted values, as Series.quantile
+    without sorting again
+    ----------
+    values : np.ndarray
+            sorted values without NaN
+    q : float or np.ndarray
+            quantiles between 0 and 1
+    Returns
+    -------
+    quantiles : float or np.ndarray
+    '''
+    position = np.asarray(q, dtype=float) * (len(values) - 1)
+    below = np.floor(position).astype(int)
+    above = np.minimum(below + 1, len(values) - 1)
+    return values[below] + (values[above] - values[below]) * (position - below)
+
+
+def target_sketch(data_source, target_name, KPI_equation=None, sketch_k=200, cache_dir=None):
+    '''
+    Function to stream the sketch of a target from the data source,
+    for the "sketch" bound method
+    ----------
+    data_source : str
+            path of the data file, directory or glob the data was loaded from
+    target_name: str
+            column of interest
+    KPI_equation: str
+            KPI equation of the target, if it is a KPI
+    sketch_k:int
+        size of the sketch, the larger the more accurate
+    cache_dir: str
+        parquet cache of the parsed non-csv files, see read_source
+    Returns
+    -------
+    sketch : KLLSketch
+        sketch of the target over the rows of the source,
+        before duplicates and missing targets are dropped
+    '''
+    if data_source is None:
+        raise ValueError("bound_method='sketch' needs the data_source to stream the target from")
+    # a KPI is computed after loading, so it is not in the files
+    if KPI_equation is not None:
+        raise ValueError(f"The KPI target {target_name!r} is not in the data source, use bound_method='exact'")
+    return sketch_from_source(data_source, target_name, k=sketch_k, cache_dir=cache_dir)
+
+
+def multi_target_report(data, target_names, problem_type='max', KPI_equations=None, manual_input=None, manual_thresh=None,
+                        max_workers=None, report_format='xlsx', bound_method='exact', sketch_k=200, data_source=None, cache_dir=None,
+                        target_workers=2):
+    '''
+    Function to create the anomaly reports of several targets,
+    sharing one correlation matrix and one rendering pool
+    ----------
+    data : pd.DataFrame
+            data of intrest
+    target_names: list
+            columns of interest, one report each
+    KPI_equations: dict
+            KPI equation of each target that is a KPI
+    max_workers: int
+            number of processes rendering the files of all reports
+    target_workers: int
+            number of targets prepared at the same time
+    sketch_k, data_source, cache_dir: see target_sketch, used by the "sketch" bound method
+    other parameters: see AnomalyDetection
+    Returns
+    -------
+    one anomaly report folder per target
+    anomaly_reports_timings.csv
+        the time taken to render each file
+    '''
+    # one numeric block and one correlation matrix are shared by all targets
+    numeric_df = get_numeric_block(data).to_frame()
+    corr_matrix = numeric_df.corr()
+    KPI_equations = KPI_equations or {}
+    sketches = {name: target_sketch(data_source, name, KPI_equations.get(name), sketch_k, cache_dir) if bound_method == 'sketch' else None
+                for name in target_names}
+    reports = [AnomalyDetection(data, name, problem_type, KPI_equations.get(name), manual_input, manual_thresh,
+                                max_workers=max_workers, report_format=report_format, bound_method=bound_method, sketch=sketches[name])
+               for name in target_names]
+    builders = [ReportBuilder(max_workers=max_workers) for _ in reports]
+
+    # bounds, splits and top tags of each target in a thread, the files of all targets in one process pool
+    with ThreadPoolExecutor(max_workers=max(min(len(reports), target_workers), 1)) as executor:
+        futures = [executor.submit(report.anomaly_report, corr_matrix, report_builder, numeric_df)
+                   for report, report_builder in zip(reports, builders)]
+        for future in futures:
+            future.result()
+
+    builder = ReportBuilder(max_workers=max_workers)
+    for name, report_builder in zip(target_names, builders):
+        builder.extend(report_builder, prefix=name + ': ')
+    builder.render(timings_path='./Data_Cleansing/anomaly_reports_timings.csv')
+
+
 class AnomalyDetection:
         """
         Class to automate the detection of anomalies 
@@ -38,14 +141,55 @@ class AnomalyDetection:
         manual_thresh:float 
             0<x<1 threshold for determining anomalous 
             instances 
+        report_format:str
+            file format of the report tables: xlsx, csv or parquet
+        bound_method:str
+            how the quantiles and min/max of the bounds are found
+            "exact": from the whole target column
+            "sketch": from a KLL quantile sketch of the target
+        sketch:KLLSketch
+            sketch of the target streamed from disk or merged across
+            partitions, see target_sketch, needed by the "sketch" method
         """
-        def __init__(self, data, target_name: str = '', problem_type: str = 'max',KPI_equation = None, manual_input=None, manual_thresh=None):
+        def __init__(self, data, target_name: str = '', problem_type: str = 'max',KPI_equation = None, manual_input=None, manual_thresh=None,
+                     max_workers=None, report_format='xlsx', bound_method='exact', sketch=None):
             self.df = data
             self.target_name = target_name
             self.problem_type = problem_type
             self.manual_input = manual_input
             self.manual_thresh = manual_thresh
             self.KPI_equation = KPI_equation
+            # the number of processes rendering the report files
+            self.max_workers = max_workers
+            self.report_format = report_format
+            if bound_method not in ('exact', 'sketch'):
+                raise ValueError("Invalid bound method! Choose from: exact, sketch")
+            if bound_method == 'sketch' and sketch is None:
+                raise ValueError("bound_method='sketch' needs a sketch of the target, see target_sketch")
+            self.bound_method = bound_method
+            self.sketch = sketch
+
+        def __target_stats(self, quantiles):
+            '''
+            Function to get the quantiles, min and max
+            of the target tag with the bound method
+            ----------
+            quantiles: float or list
+                quantiles to find
+            Returns
+            -------
+            quantiles : float or pd.Series
+                quantiles of the target tag
+            minimum : float
+                min of the target tag
+            maximum : float
+                max of the target tag
+            '''
+            if self.bound_method == 'sketch':
+                return self.sketch.quantile(quantiles), self.sketch.min, self.sketch.max
+
+            target = self.df[self.target_name]
+            return target.quantile(quantiles), target.min(), target.max()
 
         def __get_bound(self):
             '''
@@ -73,14 +217,14 @@ class AnomalyDetection:
             print('Finding bounds...')
             if self.manual_thresh == None:
                 # determining Q1,Q3 and iqr
-                quartiles = self.df[self.target_name].quantile([0.25, 0.75])
+                quartiles, minimum, maximum = self.__target_stats([0.25, 0.75])
                 iqr = quartiles[0.75] - quartiles[0.25]
 
                 if self.problem_type == 'max' or self.problem_type == 'max_equal':
                     lower = quartiles[0.25] - (1.5*iqr)
-                    upper = max(self.df[self.target_name])   
+                    upper = maximum
                 elif self.problem_type == 'min' or self.problem_type == 'min_equal':
-                    lower = min(self.df[self.target_name])
+                    lower = minimum
                     upper = quartiles[0.75] + (1.5*iqr)
                     # making sure there are no negative values
                     if lower < 0:
@@ -94,12 +238,12 @@ class AnomalyDetection:
                 else:
                     raise Exception('Invalid Pproblem Type')
             else:
-                custom_quartile = self.df[self.target_name].quantile(self.manual_thresh)
+                custom_quartile, minimum, maximum = self.__target_stats(self.manual_thresh)
                 if self.problem_type == 'max' or self.problem_type == 'max_equal':
                     lower = custom_quartile
-                    upper = max(self.df[self.target_name])   
+                    upper = maximum
                 elif self.problem_type == 'min' or self.problem_type == 'min_equal':
-                    lower = min(self.df[self.target_name])
+                    lower = minimum
                     upper = custom_quartile
                     # making sure there are no negative values
                     if lower < 0:
@@ -115,7 +259,8 @@ class AnomalyDetection:
         def __get_anomalies(self):
             '''
             Function to seperate the good and bad outputs from 
-            each other in a dataset based on a certain threshold
+            each other in a dataset based on a certain threshold,
+            as a mask so no copy of the data is made
             ----------
             df : pd.DataFrame
                     data of intrest
@@ -130,10 +275,13 @@ class AnomalyDetection:
                 manual threshold to compare to
             Returns
             -------
-            optimal : pd.DataFrame
-                data of optimal instances
-            suboptimal : pd.DataFrame
-                data of suboptimal instances
+            anomaly : np.ndarray
+                boolean mask of the suboptimal instances,
+                the optimal instances are ~anomaly
+            lower : float
+                lower bound of the target tag
+            upper : float
+                upper bound of the target tag
             '''
             # creating the filter column based on given threshold
             if type(self.manual_input) == tuple:
@@ -143,33 +291,158 @@ class AnomalyDetection:
             else: 
                 print('invalid data type')
             
-            df = self.df.copy()
+            target = self.df[self.target_name].to_numpy()
 
             # finding the actual anomalies 
             if self.problem_type == 'max_equal':
-                df['Anomaly'] = np.where(np.greater_equal(self.df[self.target_name],lower), 0, 1)
+                anomaly = ~np.greater_equal(target, lower)
             elif self.problem_type == 'max':
-                df['Anomaly'] = np.where(np.greater(self.df[self.target_name],lower), 0, 1)
+                anomaly = ~np.greater(target, lower)
             elif self.problem_type == 'min':
-                df['Anomaly'] = np.where(np.less(self.df[self.target_name],upper), 0, 1)
+                anomaly = ~np.less(target, upper)
             elif self.problem_type == 'min_equal':
-                df['Anomaly'] = np.where(np.less_equal(self.df[self.target_name],upper), 0, 1)
+                anomaly = ~np.less_equal(target, upper)
             elif self.problem_type == 'both':
-                df['Anomaly'] = np.where(np.logical_and(np.greater_equal(self.df[self.target_name],lower),np.less_equal(df[self.target_name],upper)), 1, 0)
+                anomaly = np.logical_and(np.greater_equal(target, lower), np.less_equal(target, upper))
             else:
                 raise Exception('ERROR: choose another filter type')
 
-            # splitting the data based on whether or not it is optimal or suboptimal
-            optimal = df[df['Anomaly']== 0]
-            suboptimal = df[df['Anomaly']== 1]
+            return anomaly, lower, upper
 
-            return optimal, suboptimal, lower , upper
+        def split(self, data, anomaly):
+            '''
+            Function to split data into optimal and 
+            suboptimal instances with the anomaly mask
+            ----------
+            data : pd.DataFrame
+                    data to split, only these columns are copied
+            anomaly : np.ndarray
+                    boolean mask of the suboptimal instances
+            Returns
+            -------
+            optimal : pd.DataFrame
+                data of optimal instances
+            suboptimal : pd.DataFrame
+                data of suboptimal instances
+            '''
+            return data[~anomaly], data[anomaly]
+
+        def threshold_sweep(self, thresholds=None, problem_types=('max', 'min')):
+            '''
+            Function to compare a grid of thresholds and problem
+            types at about the cost of one report: the target is
+            sorted once, each threshold is a position in the sorted
+            order and the class means come from prefix sums of the
+            tags at these positions
+            ----------
+            thresholds: list
+                manual_thresh values to try, 0<x<1, None for the
+                IQR bounds, None and 0.01 to 0.99 if not given
+            problem_types: list
+                max, max_equal, min or min_equal
+            Returns
+            -------
+            summary : pd.DataFrame
+                bounds and optimal/suboptimal counts, indexed by
+                problem type and threshold ('iqr' for the IQR bounds)
+            mean_difference : pd.DataFrame
+                mean of each numeric tag over the optimal instances
+                minus over the suboptimal instances, same index
+            '''
+            if thresholds is None:
+                thresholds = [None] + list(np.round(np.arange(0.01, 1, 0.01), 2))
+            for problem_type in problem_types:
+                if problem_type not in ('max', 'max_equal', 'min', 'min_equal'):
+                    raise ValueError("Invalid problem type! Choose from: max, max_equal, min, min_equal")
+
+            # sorting the target once, NaN last as they are always suboptimal
+            target = self.df[self.target_name].to_numpy(dtype=float)
+            order = np.argsort(target, kind='stable')
+            values = target[order]
+            n_valid = int((~np.isnan(values)).sum())
+            values = values[:n_valid]
+
+            # bounds of every threshold, as __get_bound finds them
+            quartile1, quartile3 = sorted_quantile(values, [0.25, 0.75])
+            iqr = quartile3 - quartile1
+            custom = np.array([np.nan if t is None else t for t in thresholds], dtype=float)
+            custom_quartiles = sorted_quantile(values, np.nan_to_num(custom))
+            minimum, maximum = values[0], values[-1]
+
+            rows = []
+            starts = []
+            ends = []
+            for problem_type in problem_types:
+                for threshold, custom_quartile in zip(thresholds, custom_quartiles):
+                    if problem_type.startswith('max'):
+                        lower = quartile1 - (1.5*iqr) if threshold is None else custom_quartile
+                        upper = maximum
+                        # optimal instances are above lower, at the end of the sorted order
+                        start = np.searchsorted(values, lower, side='right' if problem_type == 'max' else 'left')
+                        end = n_valid
+                    else:
+                        # making sure there are no negative values
+                        lower = max(minimum, 0)
+                        upper = quartile3 + (1.5*iqr) if threshold is None else custom_quartile
+                        # optimal instances are below upper, at the start of the sorted order
+                        start = 0
+                        end = np.searchsorted(values, upper, side='left' if problem_type == 'min' else 'right')
+                    n_optimal = end - start
+                    rows.append((problem_type, 'iqr' if threshold is None else threshold, lower, upper, n_optimal, len(target) - n_optimal))
+                    starts.append(start)
+                    ends.append(end)
+
+            summary = pd.DataFrame(rows, columns=['problem_type', 'threshold', 'lower', 'upper', 'optimal', 'suboptimal'])
+            summary = summary.set_index(['problem_type', 'threshold'])
+
+            # the thresholds cut the sorted order into segments, each row falls in one of them
+            starts, ends = np.array(starts), np.array(ends)
+            breakpoints = np.unique(np.concatenate([[0, len(target)], starts, ends]))
+            rank = np.empty(len(target), dtype=np.int64)
+            rank[order] = np.arange(len(target))
+            segment = np.searchsorted(breakpoints, rank, side='right') - 1
+            segment_rows = np.bincount(segment, minlength=len(breakpoints))
+
+            # prefix sums of the tags at the breakpoints, NaN tag values are skipped like in mean()
+            numeric_df = get_numeric_block(self.df).to_frame()
+            tags = numeric_df.drop(columns=self.target_name, errors='ignore')
+            sums = np.zeros((len(breakpoints), tags.shape[1]))
+            counts = np.zeros((len(breakpoints), tags.shape[1]))
+            for j in range(tags.shape[1]):
+                column = tags.iloc[:, j].to_numpy(dtype=float)
+                missing = np.isnan(column)
+                segment_sums = np.bincount(segment, weights=np.where(missing, 0, column), minlength=len(breakpoints))
+                segment_counts = np.bincount(segment[~missing], minlength=len(breakpoints)) if missing.any() else segment_rows
+                sums[1:, j] = np.cumsum(segment_sums[:-1])
+                counts[1:, j] = np.cumsum(segment_counts[:-1])
+
+            # class means from the prefix sums, the suboptimal class is the rest of the rows
+            starts, ends = np.searchsorted(breakpoints, starts), np.searchsorted(breakpoints, ends)
+            optimal_sum = sums[ends] - sums[starts]
+            optimal_count = counts[ends] - counts[starts]
+            suboptimal_sum = sums[-1] - optimal_sum
+            suboptimal_count = counts[-1] - optimal_count
+            with np.errstate(invalid='ignore', divide='ignore'):
+                difference = optimal_sum / optimal_count - suboptimal_sum / suboptimal_count
+            mean_difference = pd.DataFrame(difference, index=summary.index, columns=tags.columns)
+
+            return summary, mean_difference
         
-        def anomaly_report(self):
+        def anomaly_report(self, corr_matrix=None, builder=None, numeric_df=None):
                 '''
                 Function to automate the creation of 
                 an anomaly report for the IES team
                 ----------
+                corr_matrix: pd.DataFrame
+                    precomputed correlation matrix of the numeric
+                    columns, shared across targets, computed once
+                    here if None
+                builder: ReportBuilder
+                    if given, the figures and tables are added to it
+                    and rendered by the caller, else rendered here
+                numeric_df: pd.DataFrame
+                    numeric view of the data shared across targets,
+                    taken from the cached numeric block if None
                 df : pd.DataFrame
                     data of intrest
                 target_name: str
@@ -212,38 +485,49 @@ class AnomalyDetection:
                 except OSError as error:
                     print(error)
 
-                #splitting the data 
-                target = self.df[self.target_name]
-                self.df = self.df.drop(self.target_name,axis=1)
-                self.df.insert(0,self.target_name,target)
-
+                # zero-copy numeric view shared by the feature selection and the correlations
+                if numeric_df is None:
+                    numeric_df = get_numeric_block(self.df).to_frame()
+                if corr_matrix is None:
+                    corr_matrix = numeric_df.corr()
+                # the target comes first, only the correlation matrix is reordered, not the data
+                order = [self.target_name] + [col for col in numeric_df.columns if col != self.target_name]
+                corr_matrix = corr_matrix.loc[order, order]
 
                 # feature selecting to find the top n most important features
-                args = FeatureSelection(self.df.select_dtypes(include=['number']),self.target_name)
-                topn , selected_features = args.correlation_selection()
+                args = FeatureSelection(numeric_df,self.target_name)
+                topn , selected_features = args.correlation_selection(corr_matrix=corr_matrix)
                 topn_list = list(topn.index)
                 print('Selected Features are' , ', '.join(topn_list))
 
                 # separtating into optimal and suboptimal outputs 
                 # filtering the top n most important features 
                 # outputing those to .csvs
-                optimaloutput, suboptimaloutput, lower, upper = self.__get_anomalies()
-                optimaloutputtop = optimaloutput[topn_list]
-                suboptimaloutputtop = suboptimaloutput[topn_list]
-                
-                optimaloutputtop.to_excel('./Data_Cleansing/'+ new_directory_name + '/xlsx/' + target_name + '_toptagsoptimal.xlsx', index=True)
-                suboptimaloutputtop.to_excel('./Data_Cleansing/'+ new_directory_name + '/xlsx/' + target_name + '_toptagssuboptimal.xlsx', index=True)
+                # only the top n columns are materialized, the rows are selected with the mask
+                anomaly, lower, upper = self.__get_anomalies()
+                n_suboptimal = int(anomaly.sum())
+                n_optimal = len(anomaly) - n_suboptimal
+                top = self.df[topn_list]
+
+                # the figures and tables are collected first and rendered together in a process pool
+                render = builder is None
+                if render:
+                    builder = ReportBuilder(max_workers=self.max_workers)
+                # optimal and suboptimal rows are written in one pass over the top tags, split by the anomaly mask
+                sink = sink_factory(self.report_format)
+                base_path = './Data_Cleansing/'+ new_directory_name + '/xlsx/' + target_name
+                builder.add(sink.path(target_name + '_toptagsoptimal') + ', ' + sink.path(target_name + '_toptagssuboptimal'), sink.write_split,
+                            top, anomaly, (base_path + '_toptagsoptimal', base_path + '_toptagssuboptimal'), index=True)
 
                 # making boxplots
-                k = len(optimaloutputtop.columns)-1
-                if not optimaloutputtop.empty and not suboptimaloutputtop.empty:
+                k = len(top.columns)-1
+                if n_optimal > 0 and n_suboptimal > 0:
                     for i in range(0,k):
                         if i % 2 == 0:
-                            optimal = optimaloutputtop.iloc[:,i:i+2]
-                            suboptimal = suboptimaloutputtop.iloc[:,i:i+2]
+                            optimal, suboptimal = self.split(top.iloc[:,i:i+2], anomaly)
                             if not optimal.dtypes.eq('<M8[ns]').any() and not suboptimal.dtypes.eq('<M8[ns]').any():
                                 vis = BoxPlots(optimal, suboptimal, target_name, optimal.columns[0], optimal.columns[1])
-                                vis.double_boxplot()
+                                builder.add(optimal.columns[0] + optimal.columns[1] + '.png', vis.double_boxplot)
                             else:
                                 raise Exception(f"Error: DateTime data detected in columns {i} and {i+1}. Please ensure numerical data is used.")
 
@@ -251,8 +535,10 @@ class AnomalyDetection:
                     raise Exception("Error: The DataFrames optimaloutputtop and/or suboptimaloutputtop are empty.")
                 
                 #creating correlation csvs
-                corr = CorrelationTypes(self.df.select_dtypes(include=['number']), topn, self.target_name)
-                corr.top_correlations()
+                corr = CorrelationTypes(numeric_df, topn, self.target_name)
+                corr.top_correlations(builder, sink, corr_matrix)
+                if render:
+                    builder.render(timings_path='./Data_Cleansing/'+ new_directory_name + '/timings.csv')
 
 
                 # Making Basic Stats for IES
@@ -289,9 +575,9 @@ class AnomalyDetection:
                         f.write('\n')
                         f.write('Number of important tags: ' + str(len(topn)))
                         f.write('\n')
-                        f.write('Total number of sub-optimal ('+ self.target_name +' '+  oppositeype + bound + ') instances: ' + str(len(suboptimaloutput)))
+                        f.write('Total number of sub-optimal ('+ self.target_name +' '+  oppositeype + bound + ') instances: ' + str(n_suboptimal))
                         f.write('\n')
-                        f.write('Total number of optimal (' + self.target_name +' ' + threshtype + bound  + ') instances: ' + str(len(optimaloutput)))
+                        f.write('Total number of optimal (' + self.target_name +' ' + threshtype + bound  + ') instances: ' + str(n_optimal))
                 else: 
                     with open('./Data_Cleansing/'+ new_directory_name +'/stats.txt', 'w') as f:
                         f.write("Maestro utilized KPI " + self.target_name + ' - ' + self.KPI_equation + " to determine if the process has been operating within range. The entire data set was broken down into hourly instances and then classified by Maestro as Optimal or Sub-Optimal to then perform optimization.")
@@ -304,9 +590,9 @@ class AnomalyDetection:
                         f.write('\n')
                         f.write('Number of important tags: ' + str(len(topn)))
                         f.write('\n')
-                        f.write('Total number of sub-optimal ('+ self.target_name +' '+ oppositeype + bound + ') instances: ' + str(len(suboptimaloutput)))
+                        f.write('Total number of sub-optimal ('+ self.target_name +' '+ oppositeype + bound + ') instances: ' + str(n_suboptimal))
                         f.write('\n')
-                        f.write('Total number of optimal (' + self.target_name +' ' + threshtype + bound  + ') instances: ' + str(len(optimaloutput)))
+                        f.write('Total number of optimal (' + self.target_name +' ' + threshtype + bound  + ') instances: ' + str(n_optimal))
 
                 print('Done')
         
@@ -0,0 +1,73 @@
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class ColumnBlockExecutor:
+    '''
+    Run a function on blocks of columns of a DataFrame, in a thread or process pool
+
+    Threads suit NumPy/pandas kernels that release the GIL. Processes need a picklable
+    (module-level) function, and pay for sending each block to the worker.
+
+    Parameters:
+    - max_workers: the number of workers, 1 runs the blocks one after another in the calling thread
+    - block_size: the number of columns per block
+    - backend: thread or process
+    '''
+    def __init__(self, max_workers: int = 1, block_size: int = 256, backend: str = 'thread'):
+        if backend not in ('thread', 'process'):
+            raise ValueError("Invalid backend! Choose from: thread, process")
+        self.max_workers = max_workers
+        self.block_size = max(int(block_size), 1)
+        self.backend = backend
+
+    def blocks(self, data: pd.DataFrame) -> list[pd.DataFrame]:
+        '''
+        Split a DataFrame into blocks of adjacent columns
+
+        Parameters:
+        - data: the input data
+
+        Returns:
+        - the blocks, in column order
+        '''
+
+        return [data.iloc[:, start:start + self.block_size] for start in range(0, data.shape[1], self.block_size)]
+
+    def map(self, func, data: pd.DataFrame) -> list:
+        '''
+        Run a function on each block of columns
+
+        Parameters:
+        - func: a function taking a DataFrame block
+        - data: the input data
+
+        Returns:
+        - the results of the blocks, in column order
+        '''
+
+        blocks = self.blocks(data)
+        if self.max_workers == 1 or len(blocks) <= 1:
+            return [func(block) for block in blocks]
+
+        pool = ThreadPoolExecutor if self.backend == 'thread' else ProcessPoolExecutor
+        with pool(max_workers=self.max_workers) as executor:
+            return list(executor.map(func, blocks))
+
+    def apply(self, func, data: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Run a DataFrame -> DataFrame function on each block of columns and stitch the results
+
+        Parameters:
+        - func: a function taking and returning a DataFrame block with the same columns
+        - data: the input data
+
+        Returns:
+        - data: the results of the blocks, concatenated in column order
+        '''
+
+        results = self.map(func, data)
+        if not results:
+            return func(data)
+
+        return pd.concat(results, axis=1)
@@ -7,8 +7,17 @@ import os
 # in python script, use absolute path of this file to add the parent directory to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from Data_Visualization.eda import EDA_Visualization
-from Data_Cleansing.anomaly_detection import AnomalyDetection
+from Data_Cleansing.anomaly_detection import AnomalyDetection, multi_target_report, target_sketch
+from Data_Cleansing.rolling_outliers import OutlierFlags, rolling_median_scores, ewma_scores
+from Data_Cleansing.run_lengths import mask_intervals, long_runs_mask, is_sample_count
+from Data_Cleansing.hashing import frame_hashes
+from Data_Cleansing.column_blocks import ColumnBlockExecutor
+from Data_Exploration.dataset_profile import null_mask
+from Data_Exploration.data_loader import BLANKS_NORMALIZED, normalize_blanks
+from Data_Exploration.numeric_block import NumericBlock, get_numeric_block, numeric_columns
 import json
+import warnings
+from functools import partial
 
 
 # Strategy Pattern using ABC
@@ -17,179 +26,442 @@ class FillMissingMethod(ABC):
     def fill_missing(self, data: pd.DataFrame) -> pd.DataFrame:
         pass
 
+    # per-column fill values, None for methods that do not fill with a statistic
+    def fill_values(self, data: pd.DataFrame) -> pd.Series:
+        return None
+
 class FillMissingByMean(FillMissingMethod):
     def fill_missing(self, data: pd.DataFrame) -> pd.DataFrame:
-        return data.fillna(data.mean())
+        return data.fillna(self.fill_values(data))
+
+    def fill_values(self, data: pd.DataFrame) -> pd.Series:
+        return data.mean()
 
 class FillMissingByMedian(FillMissingMethod):
     def fill_missing(self, data: pd.DataFrame) -> pd.DataFrame:
-        return data.fillna(data.median())
+        return data.fillna(self.fill_values(data))
+
+    def fill_values(self, data: pd.DataFrame) -> pd.Series:
+        return data.median()
 
 class FillMissingByMode(FillMissingMethod):
     def fill_missing(self, data: pd.DataFrame) -> pd.DataFrame:
-        return data.fillna(data.mode().iloc[0])
+        return data.fillna(self.fill_values(data))
+
+    def fill_values(self, data: pd.DataFrame) -> pd.Series:
+        return data.mode().iloc[0]
+
+# fill strategies with a max gap leave the gaps longer than max_gap missing, instead of
+# carrying values across long outages
+class GapLimitedFill(FillMissingMethod):
+    def __init__(self, max_gap=None):
+        # number of samples (int or float), or a time span such as '6h' for a datetime index
+        self.max_gap = max_gap
+
+    def limit_gaps(self, data: pd.DataFrame, filled: pd.DataFrame) -> pd.DataFrame:
+        if self.max_gap is None:
+            return filled
+        # a time offset is measured on the index, so it needs a DatetimeIndex
+        if not is_sample_count(self.max_gap) and not isinstance(data.index, pd.DatetimeIndex):
+            raise ValueError(f"max_gap={self.max_gap!r} is a time offset but the index is a {type(data.index).__name__}, "
+                             "use a number of samples or None")
+        long_gaps = long_runs_mask(data.isnull().to_numpy(), data.index, self.max_gap)
+        return filled.mask(long_gaps)
 
 # Forward fill
-class FillMissingByLastKnownValue(FillMissingMethod):
+class FillMissingByLastKnownValue(GapLimitedFill):
     def fill_missing(self, data: pd.DataFrame) -> pd.DataFrame:
-        return data.fillna(method='ffill')
+        return self.limit_gaps(data, data.ffill())
 
 # Backward fill
-class FillMissingByNextKnownValue(FillMissingMethod):
+class FillMissingByNextKnownValue(GapLimitedFill):
     def fill_missing(self, data: pd.DataFrame) -> pd.DataFrame:
-        return data.fillna(method='bfill')
+        return self.limit_gaps(data, data.bfill())
     
-# Interpolation Fill
-class FillMissingByInterpolation(FillMissingMethod):
+# Interpolation Fill, time-weighted with method='time' when the index is a DatetimeIndex
+class FillMissingByInterpolation(GapLimitedFill):
+    def __init__(self, method: str = 'linear', max_gap=None):
+        super().__init__(max_gap)
+        self.method = method
+
     def fill_missing(self, data: pd.DataFrame) -> pd.DataFrame:
-        return data.interpolate(method='linear', limit_direction='both')
+        method = self.method if self.method != 'time' or isinstance(data.index, pd.DatetimeIndex) else 'linear'
+        return self.limit_gaps(data, data.interpolate(method=method, limit_direction='both'))
     
 class NotFill(FillMissingMethod):
     def fill_missing(self, data: pd.DataFrame) -> pd.DataFrame:
         return data
 
-def fill_method_factory(method="forward"):
+def fill_method_factory(method="forward", max_gap=None):
     """Factory Method"""
     filler = {
         "mean": FillMissingByMean(),
         "median": FillMissingByMedian(),
         "mode": FillMissingByMode(),
-        "forward": FillMissingByLastKnownValue(),
-        "back": FillMissingByNextKnownValue(),
+        "forward": FillMissingByLastKnownValue(max_gap),
+        "back": FillMissingByNextKnownValue(max_gap),
+        "interpolate": FillMissingByInterpolation('linear', max_gap),
+        "time": FillMissingByInterpolation('time', max_gap),
         "notfill": NotFill()
     }
 
     return filler[method]
 
 
+# column-block kernels, at module level so a process pool can pickle them
+def zscore_block(data: pd.DataFrame, threshold: float) -> tuple[np.ndarray, np.ndarray]:
+    values = data.to_numpy()
+    # population std (ddof=0) like stats.zscore, constant columns get NaN scores
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.abs((values - values.mean(axis=0)) / values.std(axis=0))
+    return scores, scores > threshold
+
+def rolling_flags_block(data: pd.DataFrame, method: str, window, min_periods: int, threshold: float) -> np.ndarray:
+    score_methods = {'median': rolling_median_scores, 'ewma': ewma_scores}
+    scores = score_methods[method](data.astype(np.float64), window, min_periods=min_periods)
+    return np.packbits(scores.to_numpy() > threshold, axis=0)
+
+def shutdown_block(data: pd.DataFrame, manual_shutdown_thresh: float = None) -> tuple[np.ndarray, np.ndarray]:
+    values = data.to_numpy()
+    if manual_shutdown_thresh is None:
+        # using z-score to get the lower bound as the threshold
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            thresh = np.nanmean(values, axis=0, dtype=np.float64) - 3 * np.nanstd(values, axis=0, dtype=np.float64)
+    else:
+        thresh = np.full(data.shape[1], manual_shutdown_thresh, dtype=np.float64)
+    # NaN compares False, so missing values are not counted as shut down
+    return thresh, values <= thresh
+
+
 class DataCleansing:
-    def __init__(self, data: pd.DataFrame = None):
+    def __init__(self, data: pd.DataFrame = None, executor: ColumnBlockExecutor = None):
         self.data = data
+        # runs the per-column work of the cleansing steps on blocks of columns
+        self.executor = executor if executor is not None else ColumnBlockExecutor()
+        # the fill method of the last handle_missing_values call ('auto' resolved),
+        # and its per-column fill values if the method uses them
+        self.fill_values = None
+        self.fill_method = None
+        # the (n_rows, n_columns) outlier mask of the last detect_outliers_matrix call
+        self.outlier_mask = None
+        # the row hashes seen by remove_duplicates and the columns it dropped, kept across chunks
+        self.seen_row_hashes = np.array([], dtype=np.uint64)
+        self.dropped_duplicate_columns = None
+        # the shutdown intervals of the last detect_shutdown call
+        self.shutdown_periods = None
+        self.plant_shutdown_periods = None
     
-    def remove_duplicates(self, data: pd.DataFrame) -> pd.DataFrame:
+    def remove_duplicates(self, data: pd.DataFrame, drop_columns: bool = False, keep_columns: list = []) -> pd.DataFrame:
         '''
         Remove duplicates from the data
 
+        Rows and columns are compared by 64-bit hashes of their values. The hashes of the rows
+        seen so far are kept in self.seen_row_hashes, so calling this again on a later chunk or
+        batch also drops rows that duplicate a row of an earlier one. Columns dropped on the
+        first call are dropped from the later ones too.
+
         Parameters:
         - data: the data to be cleaned
+        - drop_columns: whether to also drop columns identical to an earlier column and constant columns
+        - keep_columns: the columns never to drop, such as the target
 
         Returns:
         - data: the data after removing duplicates
         '''
 
         data = data if data is not None else self.data
-        # drop duplicate rows
-        data = data.drop_duplicates()
-
-        # drop columns with all values be the same
-        # duplicate_columns = data.columns[data.T.duplicated(keep='first')]
-        # print("Dropped columns:", duplicate_columns)
-        # data = data.drop(duplicate_columns, axis=1)
+        row_hashes, column_digests, constant = frame_hashes(data)
+
+        # drop duplicate rows, within the data and against the rows of earlier calls
+        duplicated = pd.Series(row_hashes).duplicated().to_numpy() | np.isin(row_hashes, self.seen_row_hashes)
+        self.seen_row_hashes = np.union1d(self.seen_row_hashes, row_hashes)
+        if duplicated.any():
+            data = data[~duplicated]
+
+        # drop columns identical to an earlier column, or with all values be the same
+        if drop_columns:
+            if self.dropped_duplicate_columns is None:
+                is_duplicate = column_digests.duplicated().to_numpy() | (constant.to_numpy() & (len(data) > 1))
+                self.dropped_duplicate_columns = [col for col in data.columns[is_duplicate] if col not in keep_columns]
+                print("Dropped columns:", self.dropped_duplicate_columns)
+            data = data.drop(columns=self.dropped_duplicate_columns, errors='ignore')
 
         # for columns with same column names, set an alert and keep the first one
         if len(data.columns) != len(set(data.columns)):
             print("Warning: There are columns with same column names, we have kept the first one and drop the rest")
             print("Dropped columns:", data.columns[data.columns.duplicated()])
             data = data.loc[:, ~data.columns.duplicated()]
-        
+
         return data
 
     
-    def handle_missing_values(self, data: pd.DataFrame = None, target_list: list = [], drop_thresh: float = 0.5, fill_missing_method="forward") -> pd.DataFrame:
+    def handle_missing_values(self, data: pd.DataFrame = None, target_list: list = [], drop_thresh: float = 0.5, fill_missing_method="auto",
+                              save_path: str = './temp_save/fill_values.json', max_gap=None) -> pd.DataFrame:
         '''
         Handle missing values in the data
 
+        The null mask is computed once, the dropped rows, the dropped columns and the columns to
+        fill are all derived from it. The fill values of mean/median/mode are saved to save_path,
+        so apply_fill_values can fill inference batches with the same statistics.
+
         Parameters:
         - data: the data to be cleaned
         - target_list: the list of columns to be used as target
         - drop_threshold: the threshold for dropping columns with missing values
-        - fill_missing_method: the method for filling missing values
+        - fill_missing_method: the method for filling missing values, auto for time interpolation
+          if the data has a datetime index and forward fill otherwise
+        - save_path: the json file the fill values are saved to, None to not save them
+        - max_gap: for forward/back/interpolate/time, gaps longer than this (a number of samples or
+          a time offset such as '6h') are left missing
 
         Returns:
         - data: the data after handling missing values
         '''
         
         data = data if data is not None else self.data
-        # convert "" to NaN
-        data = data.replace(r'^\s*$', np.nan, regex=True)
+        # convert "" to NaN, only needed if the frame was not normalized at load time
+        if not data.attrs.get(BLANKS_NORMALIZED):
+            data = normalize_blanks(data)
+        mask = null_mask(data)
 
         # drop rows with missing values in the target_list
-        print("# rows dropped with missing values in the target variable:", data.shape[0] - data.dropna(subset=target_list).shape[0])
-        data = data.dropna(subset=target_list)
-
-
-        # drop columns that have missing values more than the threshold
-        dropped_cols = [i for i in data.columns if data[i].isnull().sum() / data.shape[0] > drop_thresh]
+        target_list = [target_list] if isinstance(target_list, str) else target_list
+        target_rows = data.columns.get_indexer(target_list)
+        if (target_rows < 0).any():
+            raise KeyError([name for name, row in zip(target_list, target_rows) if row < 0])
+        target_missing = mask[target_rows].any(axis=0)
+        print("# rows dropped with missing values in the target variable:", target_missing.sum())
+
+        # drop columns that have missing values more than the threshold, counted on the kept rows
+        missing_counts = mask.sum(axis=1) - mask[:, target_missing].sum(axis=1)
+        missing_counts = pd.Series(missing_counts, index=data.columns)
+        missing_fraction = missing_counts / max(len(data) - target_missing.sum(), 1)
+        dropped_cols = missing_fraction[missing_fraction > drop_thresh].index.tolist()
         print("Dropped columns:", dropped_cols)
+
+        if target_missing.any():
+            data = data[~target_missing]
         data = data.drop(columns=dropped_cols)
         
         # fill missing values for the rest of the columns
+        if fill_missing_method == 'auto':
+            fill_missing_method = 'time' if isinstance(data.index, pd.DatetimeIndex) else 'forward'
+        self.fill_method = fill_missing_method
         try:
-            numeric_columns = data.select_dtypes(include=['number'])
-            data[numeric_columns.columns] = fill_method_factory(fill_missing_method).fill_missing(numeric_columns)
+            filler = fill_method_factory(fill_missing_method, max_gap=max_gap)
+            numeric_cols = numeric_columns(data)
+            # keep the statistics of every numeric column, so appended rows can be filled with the same values
+            self.fill_values = self.get_fill_values(filler, data, numeric_cols)
+            # only columns with missing values change, the others keep their dtype and are not copied
+            filled_cols = numeric_cols[missing_counts[numeric_cols].to_numpy() > 0]
+            if len(filled_cols) > 0:
+                # a fresh copy of the columns to fill, filled in place below
+                block = NumericBlock.from_frame(data, dtype=np.float64, columns=filled_cols)
+                if self.fill_values is not None:
+                    for col in filled_cols:
+                        values = block.column(col)
+                        values[np.isnan(values)] = self.fill_values[col]
+                    filled = block.to_frame()
+                else:
+                    filled = self.executor.apply(filler.fill_missing, block.to_frame())
+                float_dtypes = {col: dt for col, dt in data.dtypes[filled_cols].items() if pd.api.types.is_float_dtype(dt)}
+                # replace the columns on a shallow copy, the caller's frame is left untouched
+                data = data.copy(deep=False)
+                data[filled_cols] = filled.astype(float_dtypes)
+            if self.fill_values is not None and save_path is not None:
+                self.save_fill_values(fill_missing_method, save_path)
             print("Filled missing values using %s" % fill_missing_method)
+            if max_gap is not None and len(filled_cols) > 0:
+                print("# values left missing in gaps longer than %s:" % max_gap, int(data[filled_cols].isnull().sum().sum()))
         except KeyError:
-            print("Filling failed. Invalid fill missing method, choose from: mean, median, model, forward, back, notfill")
+            print("Filling failed. Invalid fill missing method, choose from: auto, mean, median, mode, forward, back, interpolate, time, notfill")
             
         return data
 
-    def detect_shutdown(self, data: pd.DataFrame = None, manual_shutdown_thresh: float = None, drop_thresh: float = 0.5) -> pd.DataFrame:
+    def get_fill_values(self, filler: FillMissingMethod, data: pd.DataFrame, columns: pd.Index) -> pd.Series:
+        '''
+        Compute the fill values of a method a block of columns at a time, each block as float64
+
+        Parameters:
+        - filler: the fill method
+        - data: the input data
+        - columns: the numeric columns
+
+        Returns:
+        - fill_values: the fill value of each column, None for methods that do not fill with a statistic
+        '''
+
+        block_size = self.executor.block_size
+        blocks = [data[columns[start:start + block_size]].astype(np.float64) for start in range(0, len(columns), block_size)]
+        fill_values = [filler.fill_values(block) for block in blocks or [data[columns].astype(np.float64)]]
+        if fill_values[0] is None:
+            return None
+
+        return pd.concat(fill_values)
+
+    def save_fill_values(self, fill_missing_method: str, save_path: str = './temp_save/fill_values.json'):
+        '''
+        Save the fill values of the last handle_missing_values call
+
+        Parameters:
+        - fill_missing_method: the method the values were computed with
+        - save_path: the json file to save to
+        '''
+
+        os.makedirs(os.path.dirname(save_path) or '.', exist_ok=True)
+        with open(save_path, 'w') as f:
+            json.dump({'method': fill_missing_method, 'values': {str(col): float(value) for col, value in self.fill_values.items()}}, f)
+
+    def apply_fill_values(self, data: pd.DataFrame = None, save_path: str = './temp_save/fill_values.json') -> pd.DataFrame:
+        '''
+        Fill the missing values of a new batch with the saved training statistics, without recomputing them
+
+        Parameters:
+        - data: the batch to be filled
+        - save_path: the json file saved by handle_missing_values
+
+        Returns:
+        - data: the batch with the missing values of the saved columns filled
+        '''
+
+        data = data if data is not None else self.data
+        with open(save_path, 'r') as f:
+            fill_values = pd.Series(json.load(f)['values'], dtype=np.float64)
+        fill_values = fill_values[fill_values.index.isin(data.columns)]
+
+        return data.fillna(fill_values)
+
+    def detect_shutdown(self, data: pd.DataFrame = None, manual_shutdown_thresh: float = None, drop_thresh: float = 0.5,
+                        plant_fraction: float = 0.5) -> pd.DataFrame:
         '''
         Detect shutdown period in the time-series data
 
+        The contiguous shutdown periods are kept in self.shutdown_periods (per column) and
+        self.plant_shutdown_periods (rows where at least plant_fraction of the columns are shut down),
+        as tables of intervals with start, end and duration.
+
         Parameters:
         - data: the data to be cleaned
         - manual_shutdown_thresh: the manually input threshold for detecting as a shutdown, such as 0
         - drop_thresh: the threshold for dropping columns, if the % of shutdown period is more than this threshold, the column will be dropped
+        - plant_fraction: the fraction of columns that must be shut down for a plant-wide shutdown
 
         Returns:
         - data: the data after detecting shut down
         '''
 
         data = data if data is not None else self.data
+        block = get_numeric_block(data)
 
-        # get the threshold for shutdown period
-        if manual_shutdown_thresh is None:
-            thresh_list = []
-            for col_name in data.columns:
-                # using z-score to get the lower bound as the threshold
-                thresh_list.append(np.mean(data[col_name]) - 3 * np.std(data[col_name]))
-        else:
-            thresh_list = [manual_shutdown_thresh] * len(data.columns)
+        # get the threshold and the shutdown mask, one reduction per block of columns
+        results = self.executor.map(partial(shutdown_block, manual_shutdown_thresh=manual_shutdown_thresh), block.to_frame())
+        thresh = np.concatenate([result[0] for result in results]) if results else np.zeros(0)
+        shutdown_mask = np.concatenate([result[1] for result in results], axis=1) if results else np.zeros((len(data), 0), dtype=bool)
+        thresh_list = pd.Series(thresh, index=block.columns).reindex(data.columns)
 
         # save the threshold to a json file
         with open('temp_save/shutdown_thresh.json', 'w') as f:
-            json.dump(thresh_list, f)
+            json.dump(thresh_list.astype(float).tolist(), f)
+
+        self.shutdown_periods = mask_intervals(shutdown_mask, data.index, block.columns)
+        plant_mask = shutdown_mask.mean(axis=1) >= plant_fraction if len(block.columns) > 0 else np.zeros(len(data), dtype=bool)
+        self.plant_shutdown_periods = mask_intervals(plant_mask, data.index, ['plant'])
 
         # get the % of shutdown period for each column
-        shutdown_percent = data[data <= thresh_list].count() / data.shape[0]
+        shutdown_percent = pd.Series(shutdown_mask.sum(axis=0) / data.shape[0], index=block.columns)
         # get the columns that have shutdown period more than the threshold
         dropped_cols = shutdown_percent[shutdown_percent > drop_thresh].index.tolist()
         print("Dropped columns:", dropped_cols)
         data = data.drop(columns=dropped_cols)
 
         return data
+
+    def remove_shutdown_periods(self, data: pd.DataFrame = None, periods: pd.DataFrame = None) -> pd.DataFrame:
+        '''
+        Remove the rows of shutdown periods from the data
+
+        Parameters:
+        - data: the input data
+        - periods: the intervals to remove, self.plant_shutdown_periods of the last detect_shutdown call if None
+
+        Returns:
+        - data: the data without the rows of the shutdown periods
+        '''
+
+        data = data if data is not None else self.data
+        periods = periods if periods is not None else self.plant_shutdown_periods
+        if periods is None or len(periods) == 0:
+            return data
+
+        # mark interval starts with +1 and the rows after the ends with -1, a cumulative sum then covers the intervals
+        starts = data.index.searchsorted(periods['start'], side='left')
+        ends = data.index.searchsorted(periods['end'], side='right')
+        coverage = np.zeros(len(data) + 1, dtype=np.int64)
+        np.add.at(coverage, starts, 1)
+        np.add.at(coverage, ends, -1)
+        in_period = np.cumsum(coverage[:-1]) > 0
+        print("# rows removed in shutdown periods:", int(in_period.sum()))
+
+        return data[~in_period]
     
-    def generate_anomaly_report(self, data: pd.DataFrame = None, target_name : str = '', problem_type : str = 'max',KPI_equation = None, manual_input=None, manual_thresh=None):
+    def generate_anomaly_report(self, data: pd.DataFrame = None, target_name : str = '', problem_type : str = 'max',KPI_equation = None, manual_input=None, manual_thresh=None,
+                                max_workers: int = None, report_format: str = 'xlsx', bound_method: str = 'exact', sketch_k: int = 200,
+                                data_source: str = None, cache_dir: str = None):
         '''
         Generate anomaly report for the target variable in the input data
 
         Parameters:
         - data: the input data
         - target_col: the column name of the target variable
+        - max_workers: the number of processes rendering the figures and tables, one per core if None
+        - report_format: the file format of the tables: xlsx (streamed, split into sheets past the Excel row limit), csv or parquet
+        - bound_method: exact, or sketch to find the bounds from a quantile sketch of the target streamed from data_source
+        - sketch_k: the size of the quantile sketch, the larger the more accurate
+        - data_source: the path of the data file, directory or glob the data was loaded from, needed by the sketch bound method
+        - cache_dir: the parquet cache of the parsed non-csv sources, so the sketch does not parse them again
 
         Returns:
         A anomaly_report folder that has:
         - graphics: the folder containing the plots
-        - xlsx: the folder containing the excel file, including the correlation table and the final report
+        - xlsx: the folder containing the tables, including the correlation table and the final report
         - stats.txt: the file containing the basic stats for IES
+        - timings.csv: the time taken to render each file
         '''
 
         data = data if data is not None else self.data
-        anom_detect = AnomalyDetection(data, target_name, problem_type=problem_type, KPI_equation=KPI_equation,manual_input=manual_input, manual_thresh=manual_thresh)
+        sketch = target_sketch(data_source, target_name, KPI_equation, sketch_k, cache_dir) if bound_method == 'sketch' else None
+        anom_detect = AnomalyDetection(data, target_name, problem_type=problem_type, KPI_equation=KPI_equation,manual_input=manual_input, manual_thresh=manual_thresh,
+                                       max_workers=max_workers, report_format=report_format, bound_method=bound_method, sketch=sketch)
         anom_detect.anomaly_report()
 
         return
+
+    def generate_anomaly_reports(self, data: pd.DataFrame = None, target_names: list = None, problem_type : str = 'max', KPI_equations: dict = None,
+                                 manual_input=None, manual_thresh=None, max_workers: int = None, report_format: str = 'xlsx',
+                                 bound_method: str = 'exact', sketch_k: int = 200, data_source: str = None,
+                                 cache_dir: str = None, target_workers: int = 2):
+        '''
+        Generate the anomaly reports of several target variables, computing the correlation matrix once
+        and preparing the targets concurrently
+
+        Parameters:
+        - data: the input data
+        - target_names: the column names of the target variables
+        - KPI_equations: the KPI equation of each target that is a KPI
+        - target_workers: the number of targets prepared at the same time
+        - other parameters: see generate_anomaly_report
+
+        Returns:
+        One anomaly_report folder per target, and anomaly_reports_timings.csv with the time taken to render each file
+        '''
+
+        data = data if data is not None else self.data
+        multi_target_report(data, target_names, problem_type, KPI_equations, manual_input, manual_thresh,
+                            max_workers=max_workers, report_format=report_format, bound_method=bound_method, sketch_k=sketch_k,
+                            data_source=data_source, cache_dir=cache_dir, target_workers=target_workers)
+
+        return
     
     def detect_outliers(self, data: pd.DataFrame = None, col_name: str = None , threshold : float = 3):
         '''
@@ -226,6 +498,100 @@ class DataCleansing:
 
         return
 
+    def detect_outliers_matrix(self, data: pd.DataFrame = None, threshold: float = 3, columns: list = None,
+                               save_path: str = './temp_save/z_scores.npy') -> pd.DataFrame:
+        '''
+        Detect outliers for all numeric columns at once based on z-score
+
+        The absolute z-scores are computed on the shared numeric block, a block of
+        columns at a time with self.executor, and written to a (n_rows, n_columns)
+        .npy file, with the column names in a json file next to it.
+
+        Parameters:
+        - data: the input data
+        - threshold: the threshold for detecting outliers using z-score
+        - columns: the numeric columns to be checked, all numeric columns if None
+        - save_path: the .npy file the z-scores are saved to
+
+        Returns:
+        - outlier_counts: the number of outliers of each checked column
+        '''
+
+        data = data if data is not None else self.data
+        block = get_numeric_block(data)
+        columns = pd.Index(columns) if columns is not None else block.columns
+
+        # same rule as detect_outliers: columns with missing values are skipped
+        has_missing = np.array([np.isnan(block.column(col)).any() for col in columns], dtype=bool)
+        for col in columns[has_missing]:
+            print("Missing values detected in %s" % col, ", please handle missing values first")
+        columns = columns[~has_missing]
+
+        n_rows = block.shape[0]
+        os.makedirs(os.path.dirname(save_path) or '.', exist_ok=True)
+        z_scores = np.lib.format.open_memmap(save_path, mode='w+', dtype=block.values.dtype, shape=(n_rows, len(columns)))
+        self.outlier_mask = np.zeros((n_rows, len(columns)), dtype=bool)
+
+        start = 0
+        for scores, mask in self.executor.map(partial(zscore_block, threshold=threshold), block.to_frame(columns)):
+            z_scores[:, start:start + scores.shape[1]] = scores
+            self.outlier_mask[:, start:start + scores.shape[1]] = mask
+            start += scores.shape[1]
+        z_scores.flush()
+        with open(os.path.splitext(save_path)[0] + '_columns.json', 'w') as f:
+            json.dump(list(map(str, columns)), f)
+
+        outlier_counts = pd.Series(self.outlier_mask.sum(axis=0), index=columns, name='outliers')
+        for col, count in outlier_counts[outlier_counts > 0].items():
+            print("%d outliers detected in " % count + col)
+            if count > 1000:
+                eda_vis = EDA_Visualization()
+                eda_vis.visualize_outliers(data, col, np.flatnonzero(self.outlier_mask[:, columns.get_loc(col)]))
+
+        return outlier_counts
+
+    def detect_outliers_rolling(self, data: pd.DataFrame = None, window=60, method: str = 'median', threshold: float = 3.5,
+                                columns: list = None, min_periods: int = None) -> OutlierFlags:
+        '''
+        Detect outliers against a trailing window instead of the global distribution,
+        so slowly drifting tags are not flagged for the drift itself
+
+        Scores are computed for a block of columns at a time with self.executor.
+        - median: robust z-score |x - rolling median| / (1.4826 * rolling MAD)
+        - ewma: z-score against the exponentially weighted mean and std of the previous values
+
+        Parameters:
+        - data: the input data
+        - window: the window as a number of samples, or a time offset such as '1h' for a datetime index
+        - method: median or ewma
+        - threshold: the score above which a value is an outlier
+        - columns: the numeric columns to be checked, all numeric columns if None
+        - min_periods: the min number of values in a window before values are scored
+
+        Returns:
+        - flags: the bit-packed per-cell outlier flags
+        '''
+
+        data = data if data is not None else self.data
+        if method not in ('median', 'ewma'):
+            raise ValueError("Invalid method! Choose from: median, ewma")
+        if not isinstance(window, (int, np.integer)) and not isinstance(data.index, pd.DatetimeIndex):
+            raise ValueError("A time offset window needs a datetime index")
+
+        block = get_numeric_block(data)
+        columns = pd.Index(columns) if columns is not None else block.columns
+
+        packed = self.executor.map(partial(rolling_flags_block, method=method, window=window, min_periods=min_periods, threshold=threshold),
+                                   block.to_frame(columns))
+        packed = np.concatenate(packed, axis=1) if packed else np.zeros(((len(data) + 7) // 8, 0), dtype=np.uint8)
+        flags = OutlierFlags(packed, len(data), columns, data.index)
+
+        outlier_counts = flags.counts()
+        for col, count in outlier_counts[outlier_counts > 0].items():
+            print("%d outliers detected in " % count + col)
+
+        return flags
+
 
 # df = pd.read_csv('data/Essar_RE_Boilers_B21_sample.csv', parse_dates=True, index_col=0)
 # df = pd.read_csv('data/sasol_data_sample.csv', parse_dates=True, index_col=0)
@@ -0,0 +1,40 @@
+import pandas as pd
+import numpy as np
+
+
+# odd multiplier mixing the column hashes into the row hash, uint64 arithmetic wraps around
+_ROW_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def frame_hashes(data: pd.DataFrame) -> tuple[np.ndarray, pd.Series, pd.Series]:
+    '''
+    Hash the rows and the columns of a DataFrame in one pass over its columns
+
+    Each column is hashed once with pd.util.hash_pandas_object (values only, not the index).
+    The column hashes are folded into one 64-bit hash per row, and summed with
+    position-dependent weights into one 64-bit digest per column.
+
+    Parameters:
+    - data: the input data
+
+    Returns:
+    - row_hashes: the uint64 hash of each row
+    - column_digests: the uint64 digest of the content of each column
+    - constant: whether each column holds a single value (NaN included)
+    '''
+
+    n_rows = len(data)
+    row_hashes = np.zeros(n_rows, dtype=np.uint64)
+    # weights depend on the row position, so columns with the same values in another order differ
+    weights = pd.util.hash_array(np.arange(n_rows, dtype=np.uint64))
+    digests = np.zeros(data.shape[1], dtype=np.uint64)
+    constant = np.zeros(data.shape[1], dtype=bool)
+
+    with np.errstate(over='ignore'):
+        for i in range(data.shape[1]):
+            hashes = pd.util.hash_pandas_object(data.iloc[:, i], index=False).to_numpy()
+            row_hashes = row_hashes * _ROW_MULTIPLIER + hashes
+            digests[i] = (hashes * weights).sum(dtype=np.uint64)
+            constant[i] = n_rows > 0 and (hashes == hashes[0]).all()
+
+    return row_hashes, pd.Series(digests, index=data.columns), pd.Series(constant, index=data.columns)
@@ -0,0 +1,194 @@
+import pandas as pd
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Data_Exploration.data_loader import expand_sources, iter_csv_chunks, read_source
+
+
+class KLLSketch:
+    '''
+    Mergeable quantile sketch (KLL), updated chunk by chunk with bounded memory
+
+    Values are kept in compactors of growing weight: level h holds items standing for 2**h values.
+    When a level is full it is sorted and every other item is promoted to the next level,
+    so the memory stays around 3k items whatever the number of values. The rank error is
+    about 1.7/k with high probability. Min, max and count are kept exactly.
+
+    Parameters:
+    - k: the size of the top compactor, the larger the more accurate
+    - seed: the seed of the random compaction offsets
+    '''
+    def __init__(self, k: int = 200, seed: int = None):
+        self.k = max(int(k), 8)
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.min = np.nan
+        self.max = np.nan
+
+    @classmethod
+    def from_chunks(cls, chunks, k: int = 200, seed: int = None) -> 'KLLSketch':
+        '''
+        Build a sketch from an iterable of chunks, e.g. a column read with pd.read_csv(chunksize=...)
+
+        Parameters:
+        - chunks: an iterable of array-likes or Series
+        - k, seed: see KLLSketch
+
+        Returns:
+        - the sketch of all chunks
+        '''
+
+        sketch = cls(k, seed)
+        for chunk in chunks:
+            sketch.update(chunk)
+
+        return sketch
+
+    def capacity(self, level: int) -> int:
+        # lower levels shrink geometrically, the top level holds k items
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, values) -> 'KLLSketch':
+        '''
+        Add a chunk of values, NaN values are ignored
+
+        Parameters:
+        - values: an array-like or Series of numbers
+
+        Returns:
+        - the sketch itself
+        '''
+
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+
+        self.count += len(values)
+        self.min = np.fmin(self.min, values.min())
+        self.max = np.fmax(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+
+        return self
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        '''
+        Merge another sketch into this one, e.g. the sketch of another partition
+
+        Parameters:
+        - other: the sketch to merge
+
+        Returns:
+        - the sketch itself
+        '''
+
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.count += other.count
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.compress()
+
+        return self
+
+    def compress(self):
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) > self.capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(self.levels[h])
+                # an odd item stays at its level, the others are halved into the next level
+                keep = items[:len(items) % 2]
+                items = items[len(items) % 2:]
+                promoted = items[self.rng.integers(2)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                # adding a level lowers the capacities below it, so restart from the bottom
+                h = 0
+            else:
+                h += 1
+
+    def quantile(self, q):
+        '''
+        Estimate quantiles of the values seen so far
+
+        Parameters:
+        - q: a quantile or a list of quantiles, between 0 and 1
+
+        Returns:
+        - the estimated quantile, or a Series indexed by q for a list, as Series.quantile does
+        '''
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items_h), 2.0 ** h) for h, items_h in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items = items[order]
+        # rank of each item at the middle of its weight, interpolated like the exact linear quantile
+        cumulative = np.cumsum(weights[order])
+        ranks = (cumulative - weights[order] / 2) / cumulative[-1] if len(items) else cumulative
+
+        qs = np.atleast_1d(np.asarray(q, dtype=float))
+        if len(items) == 0:
+            estimates = np.full(len(qs), np.nan)
+        elif len(self.levels) == 1:
+            # nothing compacted yet, all values are kept and the quantiles are exact
+            estimates = np.quantile(items, qs)
+        else:
+            estimates = np.interp(qs, np.concatenate([[0], ranks, [1]]), np.concatenate([[self.min], items, [self.max]]))
+
+        if np.ndim(q) == 0:
+            return estimates[0]
+
+        return pd.Series(estimates, index=qs)
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def sketch_from_source(file_path: str, column: str, k: int = 200, chunk_size: int = 100000, cache_dir: str = None, seed: int = None) -> KLLSketch:
+    '''
+    Build the sketch of one column straight from the data files, without loading them
+
+    Csv files are read chunk by chunk with only the column parsed, other files (xlsx, pickle)
+    one at a time with only the column kept. A directory or glob gives one sketch per file, merged.
+
+    Parameters:
+    - file_path: the path of the data file, or a directory or glob pattern of files
+    - column: the column to sketch
+    - k, seed: see KLLSketch
+    - chunk_size: the number of csv rows per chunk
+    - cache_dir: if set, non-csv files are parsed once into the parquet cache of read_source
+
+    Returns:
+    - sketch: the sketch of the column over all files
+    '''
+
+    sketch = KLLSketch(k, seed)
+    found = False
+    for path in expand_sources(file_path):
+        # files without the column are skipped, as read_partitions leaves the column missing for their rows
+        if path.endswith('.csv'):
+            if column not in pd.read_csv(path, nrows=0).columns:
+                continue
+            chunks = (chunk[column] for chunk in iter_csv_chunks(path, parse_dates=False, index_col=None, chunk_size=chunk_size, usecols=[column]))
+        else:
+            data = read_source(path, parse_dates=False, index_col=None, cache_dir=cache_dir, columns=[column])
+            # pickles are indexed by their first column, which load_data turns back into a column
+            if data is not None and column not in data.columns and data.index.name == column:
+                data = data.reset_index()
+            if data is None or column not in data.columns:
+                continue
+            chunks = [data[column]]
+        found = True
+        sketch.merge(KLLSketch.from_chunks(chunks, k, seed))
+    if not found:
+        raise KeyError(f"Column {column!r} not found in {file_path}")
+
+    return sketch
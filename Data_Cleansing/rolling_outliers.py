@@ -0,0 +1,131 @@
+import pandas as pd
+import numpy as np
+
+
+# scales the MAD to the std of normally distributed data
+MAD_SCALE = 1.4826
+# number of set bits of every byte value, to count flags without unpacking them
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+
+class OutlierFlags:
+    '''
+    Per-cell outlier flags of a DataFrame, bit-packed along the rows
+
+    Each column takes n_rows / 8 bytes instead of n_rows bytes for a boolean mask.
+
+    Parameters:
+    - packed: the (ceil(n_rows / 8), n_columns) uint8 array from np.packbits(mask, axis=0)
+    - n_rows: the number of rows of the mask
+    - columns: the column names
+    - index: the row index
+    '''
+    def __init__(self, packed: np.ndarray, n_rows: int, columns: pd.Index, index: pd.Index):
+        self.packed = packed
+        self.n_rows = n_rows
+        self.columns = pd.Index(columns)
+        self.index = index
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray, columns: pd.Index, index: pd.Index) -> 'OutlierFlags':
+        '''
+        Pack a (n_rows, n_columns) boolean mask
+
+        Parameters:
+        - mask: the boolean mask
+        - columns: the column names
+        - index: the row index
+
+        Returns:
+        - flags: the OutlierFlags of the mask
+        '''
+
+        return cls(np.packbits(mask, axis=0), mask.shape[0], columns, index)
+
+    @property
+    def shape(self) -> tuple:
+        '''(n_rows, n_columns) of the mask'''
+        return (self.n_rows, len(self.columns))
+
+    def column(self, col_name: str) -> np.ndarray:
+        '''
+        Get the flags of a column
+
+        Parameters:
+        - col_name: the column name
+
+        Returns:
+        - the boolean flags of the column
+        '''
+
+        bits = self.packed[:, self.columns.get_loc(col_name)]
+
+        return np.unpackbits(bits, count=self.n_rows).astype(bool)
+
+    def counts(self) -> pd.Series:
+        '''
+        Get the number of flagged cells of each column
+
+        Returns:
+        - the number of outliers of each column
+        '''
+
+        return pd.Series(_POPCOUNT[self.packed].sum(axis=0), index=self.columns, name='outliers')
+
+    def to_mask(self) -> np.ndarray:
+        '''(n_rows, n_columns) boolean mask of the flags'''
+        return np.unpackbits(self.packed, axis=0, count=self.n_rows).astype(bool)
+
+    def to_frame(self) -> pd.DataFrame:
+        '''Boolean DataFrame of the flags'''
+        return pd.DataFrame(self.to_mask(), index=self.index, columns=self.columns)
+
+
+def rolling_median_scores(data: pd.DataFrame, window, min_periods: int = None) -> pd.DataFrame:
+    '''
+    Robust z-scores against a trailing window: |x - median| / (1.4826 * MAD)
+
+    The MAD is the rolling median of the absolute deviations from the rolling median.
+    Cells where the MAD is 0 (flat signal) get NaN.
+
+    Parameters:
+    - data: the numeric data
+    - window: the window as a number of samples, or a time offset such as '1h' for a datetime index
+    - min_periods: the min number of values in a window, see DataFrame.rolling
+
+    Returns:
+    - scores: the robust z-score of every cell
+    '''
+
+    median = data.rolling(window, min_periods=min_periods).median()
+    deviation = (data - median).abs()
+    mad = deviation.rolling(window, min_periods=min_periods).median()
+
+    return deviation / (MAD_SCALE * mad.where(mad > 0))
+
+
+def ewma_scores(data: pd.DataFrame, window, min_periods: int = None) -> pd.DataFrame:
+    '''
+    Z-scores against an exponentially weighted mean and std of the previous values
+
+    Parameters:
+    - data: the numeric data
+    - window: the span as a number of samples, or the halflife as a time offset such as '1h' for a datetime index
+    - min_periods: the min number of values before a score is given
+
+    Returns:
+    - scores: the z-score of every cell, NaN where the std is (close to) 0
+    '''
+
+    if isinstance(window, (int, np.integer)):
+        options = dict(span=window, min_periods=min_periods or 0)
+    else:
+        options = dict(halflife=window, times=data.index, min_periods=min_periods or 0)
+    # the variance from the mean of squares, so offset windows (mean only in pandas) work too
+    mean = data.ewm(**options).mean()
+    variance = (data * data).ewm(**options).mean() - mean * mean
+    # rounding leaves a tiny variance on flat signals, treat it as 0
+    std = np.sqrt(variance.where(variance > 1e-12 * mean * mean))
+
+    # compare each value with the statistics before it, so a spike does not mask itself
+    return (data - mean.shift(1)).abs() / std.shift(1)
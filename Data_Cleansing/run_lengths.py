@@ -0,0 +1,113 @@
+import numbers
+import datetime
+import pandas as pd
+import numpy as np
+
+
+def run_bounds(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Find the runs of True values in each column of a boolean mask
+
+    Parameters:
+    - mask: a (n_rows, n_columns) boolean mask, or a 1-d mask for a single column
+
+    Returns:
+    - columns: the column position of each run
+    - starts: the first row of each run
+    - ends: the last row of each run (inclusive)
+    runs are ordered by column, then by start
+    '''
+
+    mask = np.asarray(mask, dtype=bool)
+    if mask.ndim == 1:
+        mask = mask[:, None]
+    # pad with False so every run has a rising and a falling edge
+    padded = np.zeros((mask.shape[1], mask.shape[0] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask.T
+    edges = np.diff(padded, axis=1)
+    columns, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+
+    return columns, starts, ends - 1
+
+
+def mask_intervals(mask: np.ndarray, index: pd.Index, columns: list = None) -> pd.DataFrame:
+    '''
+    Run-length encode a boolean mask into a table of intervals
+
+    Parameters:
+    - mask: a (n_rows, n_columns) boolean mask, or a 1-d mask for a single column
+    - index: the row index of the mask
+    - columns: the column names of the mask, ['all'] for a 1-d mask if None
+
+    Returns:
+    - intervals: a DataFrame with the column, start, end, number of samples and
+      duration (end - start for a datetime index, number of samples otherwise) of each run
+    '''
+
+    col_pos, starts, ends = run_bounds(mask)
+    columns = pd.Index(columns if columns is not None else ['all'])
+    if isinstance(index, pd.DatetimeIndex):
+        duration = index[ends] - index[starts]
+    else:
+        duration = ends - starts + 1
+
+    return pd.DataFrame({
+        'column': columns[col_pos],
+        'start': index[starts],
+        'end': index[ends],
+        'samples': ends - starts + 1,
+        'duration': duration,
+    })
+
+
+def is_sample_count(max_gap) -> bool:
+    '''
+    Tell a max gap given as a number of samples from one given as a time span
+
+    Parameters:
+    - max_gap: a number of samples (any real number, e.g. 24 or 24.0 from a config),
+      or a time span as a string such as '6h' or a Timedelta
+
+    Returns:
+    - True for a number of samples, False for a time span
+    '''
+
+    if isinstance(max_gap, bool):
+        raise TypeError(f"Invalid max_gap {max_gap!r}: use a number of samples or a time span such as '6h'")
+    if isinstance(max_gap, numbers.Real):
+        return True
+    if isinstance(max_gap, (str, pd.Timedelta, datetime.timedelta, np.timedelta64)):
+        return False
+    raise TypeError(f"Invalid max_gap {max_gap!r}: use a number of samples or a time span such as '6h'")
+
+
+def long_runs_mask(mask: np.ndarray, index: pd.Index, max_gap) -> np.ndarray:
+    '''
+    Mark the cells of the runs of True values longer than max_gap, for all columns at once
+
+    Parameters:
+    - mask: a (n_rows, n_columns) boolean mask
+    - index: the row index of the mask
+    - max_gap: the max run length, as a number of samples, or as a time offset such as '6h'
+      measured between the rows just before and just after the run
+
+    Returns:
+    - a (n_rows, n_columns) boolean mask of the cells in too long runs
+    '''
+
+    col_pos, starts, ends = run_bounds(mask)
+    n_rows = mask.shape[0]
+    if is_sample_count(max_gap):
+        too_long = (ends - starts + 1) > max_gap
+    else:
+        before = index[np.maximum(starts - 1, 0)]
+        after = index[np.minimum(ends + 1, n_rows - 1)]
+        too_long = np.asarray(after - before > pd.Timedelta(max_gap))
+
+    # +1 at the first row and -1 after the last row of each run, the cumulative sum covers the runs
+    coverage = np.zeros((n_rows + 1, mask.shape[1]), dtype=np.int32)
+    np.add.at(coverage, (starts[too_long], col_pos[too_long]), 1)
+    np.add.at(coverage, (ends[too_long] + 1, col_pos[too_long]), -1)
+
+    return np.cumsum(coverage[:-1], axis=0) > 0
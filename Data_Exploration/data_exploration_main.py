@@ -1,6 +1,12 @@
 import pandas as pd
 import plotly.graph_objects as go
 import numpy as np
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Data_Exploration.dataset_profile import get_profile
+from Data_Exploration.data_loader import iter_csv_chunks, read_tag_manifest, read_source, read_partitions, expand_sources
+from Data_Exploration.memory_reduction import memory_usage, reduce_memory
 # import missingno as msno
 # from matplotlib import pyplot as plt
 
@@ -9,35 +15,64 @@ class DataExploration:
     def __init__(self):
         self.data = None
     
-    def load_data(self, file_path, parse_dates=True, index_col=0) -> pd.DataFrame:
+    def load_data(self, file_path, parse_dates=True, index_col=0, chunk_size: int = None, cache_dir: str = None, manifest_path: str = None,
+                  excel_streaming: bool = False, max_workers: int = None, extra_columns: list = None, sheet_name=0) -> pd.DataFrame:
         """
         Load data into memory
         
         Parameters:
-        - file_path: the path of the data file
+        - file_path: the path of the data file, or a directory or glob pattern of files to combine
         - parse_dates: whether to parse the dates
         - index_col: the index column
+        - chunk_size: if set, read csv files in chunks of this many rows with a compact (float32) schema
+        - cache_dir: if set, cache the parsed frame as parquet in this directory, keyed by the
+          path, size, mtime and parsing options of the file, and load it from there on later runs
+        - manifest_path: if set, only read the target and selected tags saved by the pipeline in this manifest
+        - excel_streaming: read xlsx files by streaming rows from a read-only workbook instead of pd.read_excel
+        - max_workers: the number of processes parsing the files of a directory or glob, or the sheets of a list, all cores if None
+        - extra_columns: columns read on top of the manifest, e.g. the inputs of the KPI equation
+        - sheet_name: the sheet of xlsx files, or a list of sheets (None for all sheets) read in parallel
+          and combined like partitions, a timestamp in several sheets is kept from the last one
 
         Returns:
         - self.data: the raw data
         """
         
         try:
-            if file_path.endswith('.csv'):
-                self.data = pd.read_csv(file_path, parse_dates=parse_dates, index_col=index_col)
-            elif file_path.endswith('.xlsx'):
-                self.data = pd.read_excel(file_path, parse_dates=parse_dates, index_col=index_col)
-            elif file_path.endswith('.pickle'):
-                self.data = pd.read_pickle(file_path)
-                self.data = self.data.set_index(self.data.columns[0])
-                if parse_dates:
-                    self.data.index = pd.to_datetime(self.data.index)
+            columns = read_tag_manifest(manifest_path) + list(extra_columns or []) if manifest_path is not None else None
+            options = dict(parse_dates=parse_dates, index_col=index_col, chunk_size=chunk_size, cache_dir=cache_dir,
+                           columns=columns, excel_streaming=excel_streaming, sheet_name=sheet_name)
+            file_paths = expand_sources(file_path)
+            if file_paths == [file_path]:
+                self.data = read_source(file_path, max_workers=max_workers, **options)
+            else:
+                # a directory or glob of partitions, e.g. one file per day or per unit
+                self.data = read_partitions(file_paths, max_workers=max_workers, **options)
         except FileNotFoundError:
             print("File not found")
         if (self.data.index.inferred_type == "datetime64") == False:
             self.data = self.data.reset_index()
 
         return self.data
+
+    def iter_data(self, file_path, parse_dates=True, index_col=0, chunk_size: int = 100000):
+        """
+        Stream a csv file chunk by chunk instead of loading it into memory
+
+        Parameters:
+        - file_path: the path of the csv file
+        - parse_dates: whether to parse the dates
+        - index_col: the index column
+        - chunk_size: the number of rows per chunk
+
+        Returns:
+        - a generator of DataFrames with at most chunk_size rows
+        """
+
+        if not file_path.endswith('.csv'):
+            raise ValueError("Chunked reading is only supported for csv files")
+
+        return iter_csv_chunks(file_path, parse_dates=parse_dates, index_col=index_col, chunk_size=chunk_size)
     
     
     def get_data_size(self, data: pd.DataFrame = None):
@@ -49,11 +84,33 @@ class DataExploration:
         """
 
         data = data if data is not None else self.data
-        print("Data size:", data.shape)
+        print("Data size:", get_profile(data).shape)
+        print("Memory usage: %.2f MB" % (memory_usage(data).sum() / 2**20))
 
         return
 
 
+    def reduce_memory_usage(self, data: pd.DataFrame = None, downcast_floats: bool = True, max_category_fraction: float = 0.5) -> pd.DataFrame:
+        """
+        Reduce the memory footprint of the data and print a before/after report
+
+        Parameters:
+        - data: the input data
+        - downcast_floats: whether float64 columns may become float32 (only when float32 holds every value exactly)
+        - max_category_fraction: object columns with at most this fraction of distinct values become categoricals
+
+        Returns:
+        - self.data: the data with integer and float columns downcast and low-cardinality object columns as categoricals
+        """
+
+        data = data if data is not None else self.data
+        self.data, report = reduce_memory(data, downcast_floats=downcast_floats, max_category_fraction=max_category_fraction)
+        print("Memory reduction summary:")
+        print(report.round(3).to_string())
+
+        return self.data
+
+
     def get_data_type(self, data: pd.DataFrame = None, column_name: str = None):
         """
         Return the data type for the specified column
@@ -78,7 +135,7 @@ class DataExploration:
         """
 
         data = data if data is not None else self.data
-        print("Data types summary:\n", data.dtypes.value_counts())
+        print("Data types summary:\n", get_profile(data).dtypes.value_counts())
 
         return
 
@@ -92,9 +149,8 @@ class DataExploration:
         """
 
         data = data if data is not None else self.data
-        # convert "" to NaN
-        data = data.replace(r'^\s*$', np.nan, regex=True)
-        missing_data = data.isnull().sum()
+        # "" and whitespace-only strings count as missing
+        missing_data = get_profile(data).missing_counts
         print("Missing data summary:")
         print(missing_data[missing_data > 0])
 
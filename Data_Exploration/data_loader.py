@@ -0,0 +1,563 @@
+import pandas as pd
+import numpy as np
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from operator import itemgetter
+from typing import Iterator
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Data_Exploration.memory_reduction import float32_lossless
+
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
+# whitespace-only fields the csv parser should read as NaN, on top of pandas' default na_values
+BLANK_NA_VALUES = [' ', '  ', '   ', '\t']
+# set in DataFrame.attrs once blank strings have been converted to NaN
+BLANKS_NORMALIZED = 'blanks_normalized'
+# file types read_source can parse
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.pickle')
+
+
+def infer_csv_schema(file_path: str, index_col=0, sample_rows: int = 10000, usecols: list = None) -> dict:
+    '''
+    Infer a compact schema for a csv file from a sample of its rows
+
+    Parameters:
+    - file_path: the path of the csv file
+    - index_col: the index column
+    - sample_rows: the number of rows used to infer the schema
+    - usecols: the columns to read, all columns if None
+
+    Returns:
+    - schema: a dict with the column dtypes and the datetime format of the index
+    '''
+
+    sample = pd.read_csv(file_path, nrows=sample_rows, index_col=index_col, usecols=usecols, na_values=BLANK_NA_VALUES)
+
+    # downcast float columns to float32 when every sampled value survives the round trip,
+    # checked for all float columns at once
+    floats = sample.select_dtypes(include=['float64'])
+    lossless = float32_lossless(floats.to_numpy()) & floats.notnull().any().to_numpy()
+    dtypes = {col: 'float32' for col, ok in zip(floats.columns, lossless) if ok}
+
+    # guess the datetime format of the index once, so chunks skip format inference
+    date_format = None
+    if len(sample.index) > 0 and isinstance(sample.index[0], str):
+        date_format = guess_datetime_format(sample.index[0])
+
+    return {'dtypes': dtypes, 'date_format': date_format}
+
+
+def apply_csv_schema(chunk: pd.DataFrame, dtypes: dict, reported: set = None) -> pd.DataFrame:
+    '''
+    Cast the columns of a chunk to the float32 schema where they fit, the others keep the dtype
+    the parser inferred (e.g. a historian string such as "Bad" after the sampled rows)
+
+    Parameters:
+    - chunk: the chunk as read
+    - dtypes: the schema dtypes from infer_csv_schema
+    - reported: the columns already reported as not fitting, updated in place
+
+    Returns:
+    - chunk: the chunk with the fitting columns as float32
+    '''
+
+    reported = reported if reported is not None else set()
+    columns = [col for col in dtypes if col in chunk.columns]
+    numeric = [col for col in columns if pd.api.types.is_numeric_dtype(chunk[col]) and not pd.api.types.is_bool_dtype(chunk[col])]
+    lossless = float32_lossless(chunk[numeric].to_numpy(dtype=float)) if numeric else []
+    fitting = [col for col, ok in zip(numeric, lossless) if ok]
+
+    not_fitting = [col for col in columns if col not in fitting and col not in reported]
+    if not_fitting:
+        print('Columns not fitting the float32 schema from row %s, kept as read: %s' % (chunk.index[0], ', '.join(map(str, not_fitting))))
+        reported.update(not_fitting)
+
+    return chunk.astype({col: 'float32' for col in fitting})
+
+
+def iter_csv_chunks(file_path: str, parse_dates=True, index_col=0, chunk_size: int = 100000, schema: dict = None, usecols: list = None) -> Iterator[pd.DataFrame]:
+    '''
+    Read a csv file chunk by chunk with a compact schema
+
+    Parameters:
+    - file_path: the path of the csv file
+    - parse_dates: whether to parse the index as datetime
+    - index_col: the index column
+    - chunk_size: the number of rows per chunk, bounds the peak memory of the reader
+    - schema: the schema from infer_csv_schema, inferred from the first chunk_size rows if None
+    - usecols: the columns to read, all columns if None
+
+    Returns:
+    - an iterator of DataFrames with at most chunk_size rows
+    '''
+
+    schema = schema if schema is not None else infer_csv_schema(file_path, index_col=index_col, sample_rows=chunk_size, usecols=usecols)
+
+    reported = set()
+    for chunk in pd.read_csv(file_path, index_col=index_col, usecols=usecols, na_values=BLANK_NA_VALUES, chunksize=chunk_size):
+        chunk = apply_csv_schema(chunk, schema['dtypes'], reported)
+        if parse_dates:
+            try:
+                chunk.index = pd.to_datetime(chunk.index, format=schema['date_format'])
+            except (ValueError, TypeError):
+                pass
+        yield chunk
+
+
+def read_csv_chunked(file_path: str, parse_dates=True, index_col=0, chunk_size: int = 100000, sample_rows: int = 10000, usecols: list = None) -> pd.DataFrame:
+    '''
+    Read a csv file in chunks and assemble them into a compact DataFrame
+
+    Parameters:
+    - file_path: the path of the csv file
+    - parse_dates: whether to parse the index as datetime
+    - index_col: the index column
+    - chunk_size: the number of rows per chunk
+    - sample_rows: the number of rows used to infer the schema
+    - usecols: the columns to read, all columns if None
+
+    Returns:
+    - data: the DataFrame with float columns downcast to float32 where lossless
+    '''
+
+    schema = infer_csv_schema(file_path, index_col=index_col, sample_rows=sample_rows, usecols=usecols)
+    chunks = iter_csv_chunks(file_path, parse_dates=parse_dates, index_col=index_col, chunk_size=chunk_size, schema=schema, usecols=usecols)
+
+    return pd.concat(chunks)
+
+
+def read_excel_streaming(file_path: str, sheet_name=0, parse_dates=True, index_col=0, usecols: list = None) -> pd.DataFrame:
+    '''
+    Read an Excel sheet by streaming its rows with a read-only workbook
+
+    Rows are read as plain values and only the projected cells are kept, giving the same
+    dtypes as pd.read_excel. It is not faster than pd.read_excel, set cache_dir in
+    read_source to skip parsing the workbook on later runs.
+
+    Parameters:
+    - file_path: the path of the xlsx file
+    - sheet_name: the sheet to read, as a position or a name
+    - parse_dates: whether to parse the index as datetime
+    - index_col: the index column, as a position or a name, None for no index
+    - usecols: the column names to read, all columns if None
+
+    Returns:
+    - data: the sheet as a DataFrame
+    '''
+
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+        rows = sheet.iter_rows(values_only=True)
+        header = pd.Index(next(rows, ()))
+        usecols, index_col = get_projection(header, usecols, index_col)
+        if usecols is not None:
+            # keep only the projected cells of every row
+            positions = [header.get_loc(col) for col in usecols]
+            pick = itemgetter(*positions) if len(positions) > 1 else lambda row: (row[positions[0]],)
+            rows = (pick(row) for row in rows)
+            header = pd.Index(usecols)
+        data = pd.DataFrame.from_records(list(rows), columns=header)
+    finally:
+        workbook.close()
+
+    # empty columns come back as None objects, pd.read_excel gives NaN floats
+    empty_cols = data.columns[(data.dtypes == object).to_numpy() & data.isnull().all().to_numpy()]
+    if len(empty_cols) > 0:
+        data[empty_cols] = data[empty_cols].astype('float64')
+
+    if index_col is not None and index_col is not False:
+        index_name = header[index_col] if isinstance(index_col, int) and not isinstance(index_col, bool) else index_col
+        data = data.set_index(index_name)
+        if parse_dates and data.index.inferred_type in ('string', 'mixed'):
+            try:
+                data.index = pd.to_datetime(data.index)
+            except (ValueError, TypeError):
+                pass
+
+    return data
+
+
+def read_excel_sheet(file_path: str, sheet_name=0, parse_dates=True, index_col=0, columns: list = None, excel_streaming: bool = False) -> pd.DataFrame:
+    '''
+    Read one sheet of an xlsx file with pd.read_excel or the streaming reader
+
+    Parameters:
+    - file_path: the path of the xlsx file
+    - sheet_name: the sheet to read, as a position or a name
+    - parse_dates: whether to parse the index as datetime
+    - index_col: the index column, as a position or a name
+    - columns: the column names to read, all columns if None
+    - excel_streaming: read the sheet with read_excel_streaming instead of pd.read_excel
+
+    Returns:
+    - data: the sheet as a DataFrame
+    '''
+
+    if excel_streaming:
+        return read_excel_streaming(file_path, sheet_name=sheet_name, parse_dates=parse_dates, index_col=index_col, usecols=columns)
+
+    usecols, index = get_projection(pd.read_excel(file_path, sheet_name=sheet_name, nrows=0).columns, columns, index_col)
+    return pd.read_excel(file_path, sheet_name=sheet_name, parse_dates=parse_dates, index_col=index, usecols=usecols)
+
+
+def read_excel_sheets(file_path: str, sheet_names: list = None, max_workers: int = None, **options) -> dict:
+    '''
+    Read several sheets of an xlsx file in parallel
+
+    Sheets are parsed in a process pool, like the files of read_partitions: the xlsx
+    parsers are pure Python and hold the GIL, so threads would read one sheet at a time.
+
+    Parameters:
+    - file_path: the path of the xlsx file
+    - sheet_names: the sheets to read, as positions or names, all sheets if None
+    - max_workers: the number of processes, all cores if None
+    - options: the keyword arguments of read_excel_sheet
+
+    Returns:
+    - sheets: a dict of sheet name to DataFrame
+    '''
+
+    if sheet_names is None:
+        import openpyxl
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        sheet_names = workbook.sheetnames
+        workbook.close()
+
+    if len(sheet_names) <= 1 or max_workers == 1:
+        frames = [read_excel_sheet(file_path, sheet_name=sheet_name, **options) for sheet_name in sheet_names]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            frames = list(executor.map(partial(read_excel_sheet, file_path, **options), sheet_names))
+
+    return dict(zip(sheet_names, frames))
+
+
+def combine_frames(frames: list) -> pd.DataFrame:
+    '''
+    Combine the frames of several partitions (files or sheets) into one frame
+
+    The frames are aligned on their index (columns missing from a frame are NaN) and
+    sorted by time. A timestamp present in several frames is kept from the last frame
+    that has it only. Repeated timestamps within one frame, and non-datetime indexes,
+    are kept as they are, as when loading a single file.
+
+    Parameters:
+    - frames: the frames, in partition order
+
+    Returns:
+    - data: the combined data
+    '''
+
+    data = pd.concat(frames, join='outer')
+    if isinstance(data.index, pd.DatetimeIndex) and data.index.has_duplicates:
+        # keep the rows of a timestamp from the last frame that has it
+        part = np.repeat(np.arange(len(frames)), [len(frame) for frame in frames])
+        codes, _ = pd.factorize(data.index)
+        last_part = np.full(codes.max() + 1, -1)
+        np.maximum.at(last_part, codes, part)
+        data = data[part == last_part[codes]]
+    if not data.index.is_monotonic_increasing:
+        data = data.sort_index(kind='stable')
+
+    return data
+
+
+def normalize_blanks(data: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Convert empty and whitespace-only strings to NaN, once per frame
+
+    Only object and categorical columns are scanned, numeric columns cannot hold strings.
+    The frame is flagged in data.attrs, so later calls and the DatasetProfile skip the work.
+
+    Parameters:
+    - data: the input data
+
+    Returns:
+    - data: the data with blank strings replaced by NaN
+    '''
+
+    if data.attrs.get(BLANKS_NORMALIZED):
+        return data
+
+    copied = False
+    for col in data.select_dtypes(include=['object', 'category']).columns:
+        if isinstance(data[col].dtype, pd.CategoricalDtype):
+            cats = data[col].cat.categories
+            blank_cats = cats[cats.astype(str).str.fullmatch(r'\s*')]
+            if len(blank_cats) == 0:
+                continue
+            new_col = data[col].cat.remove_categories(blank_cats)
+        else:
+            new_col = data[col]
+            has_blanks = False
+            try:
+                blank = new_col.str.fullmatch(r'\s*', na=False)
+                has_blanks = blank.any()
+                if has_blanks:
+                    new_col = new_col.mask(blank)
+            except AttributeError:
+                # no string values in the column
+                pass
+            # like replace(), re-infer the dtype, e.g. numbers stored as objects become numeric
+            new_col = new_col.infer_objects()
+            if not has_blanks and new_col.dtype == object:
+                continue
+        # replace columns on a shallow copy, the caller's frame is left untouched
+        if not copied:
+            data = data.copy(deep=False)
+            copied = True
+        data[col] = new_col
+
+    data.attrs[BLANKS_NORMALIZED] = True
+
+    return data
+
+
+def cache_key(file_path: str, **options) -> str:
+    '''
+    Build the cache key of a parsed data file
+
+    Parameters:
+    - file_path: the path of the data file
+    - options: the parsing options that change the parsed frame, e.g. parse_dates and index_col
+
+    Returns:
+    - key: "<source hash>-<content hash>", the source hash identifies the path alone
+    '''
+
+    abs_path = os.path.abspath(file_path)
+    stat = os.stat(abs_path)
+    source_hash = hashlib.sha1(abs_path.encode()).hexdigest()[:16]
+    content = json.dumps({'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'options': options}, sort_keys=True, default=str)
+    content_hash = hashlib.sha1(content.encode()).hexdigest()[:16]
+
+    return source_hash + '-' + content_hash
+
+
+def read_cache(cache_dir: str, key: str) -> pd.DataFrame:
+    '''
+    Read a parsed frame from the parquet cache
+
+    Parameters:
+    - cache_dir: the cache directory
+    - key: the key from cache_key
+
+    Returns:
+    - data: the cached frame, None if there is no usable cache entry
+    '''
+
+    path = os.path.join(cache_dir, key + '.parquet')
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except (ImportError, OSError, ValueError) as error:
+        print("Cache read failed, parsing the source instead:", error)
+        return None
+
+
+def write_cache(data: pd.DataFrame, cache_dir: str, key: str):
+    '''
+    Write a parsed frame to the parquet cache, replacing stale entries of the same source
+
+    Parameters:
+    - data: the parsed frame
+    - cache_dir: the cache directory
+    - key: the key from cache_key
+    '''
+
+    os.makedirs(cache_dir, exist_ok=True)
+    source_hash = key.split('-')[0]
+    for stale_path in glob.glob(os.path.join(cache_dir, source_hash + '-*.parquet')):
+        os.remove(stale_path)
+
+    path = os.path.join(cache_dir, key + '.parquet')
+    try:
+        data.to_parquet(path)
+    except (ImportError, ValueError, TypeError, NotImplementedError) as error:
+        # e.g. pyarrow not installed, or object columns with mixed types
+        print("Cache write skipped:", error)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def write_tag_manifest(manifest_path: str, target_name: str, selected_tags: list):
+    '''
+    Save the target and the selected tags, so later runs only read those columns
+
+    Parameters:
+    - manifest_path: the path of the json manifest
+    - target_name: the name of the target column
+    - selected_tags: the tags kept by feature selection
+    '''
+
+    manifest_dir = os.path.dirname(manifest_path)
+    if manifest_dir:
+        os.makedirs(manifest_dir, exist_ok=True)
+    selected_tags = [tag for tag in dict.fromkeys(selected_tags) if tag != target_name]
+    with open(manifest_path, 'w') as f:
+        json.dump({'target': target_name, 'selected_tags': selected_tags}, f, indent=4)
+
+
+def read_tag_manifest(manifest_path: str) -> list:
+    '''
+    Read the columns listed in a manifest written by write_tag_manifest
+
+    Parameters:
+    - manifest_path: the path of the json manifest
+
+    Returns:
+    - columns: the target followed by the selected tags
+    '''
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    return [manifest['target']] + manifest['selected_tags']
+
+
+def get_projection(header: pd.Index, columns: list, index_col=0) -> tuple:
+    '''
+    Translate a list of columns into reader arguments that only parse those columns
+
+    Parameters:
+    - header: the column names of the file, including the index column
+    - columns: the columns to read, None for all columns
+    - index_col: the index column, as a position or a name
+
+    Returns:
+    - usecols: the column names to pass to the reader, None for all columns
+    - index_col: the index column as a name, since positions shift under usecols
+    '''
+
+    if columns is None:
+        return None, index_col
+
+    index_name = header[index_col] if isinstance(index_col, int) and not isinstance(index_col, bool) else index_col
+    missing = [col for col in columns if col not in header]
+    if missing:
+        print("Warning: columns in the manifest not found in the data:", missing)
+    usecols = [col for col in header if col in set(columns) or col == index_name]
+
+    return usecols, index_name
+
+
+def read_source(file_path: str, parse_dates=True, index_col=0, chunk_size: int = None, cache_dir: str = None, columns: list = None,
+                excel_streaming: bool = False, sheet_name=0, max_workers: int = None) -> pd.DataFrame:
+    '''
+    Parse a single data file, see DataExploration.load_data
+
+    Parameters:
+    - file_path: the path of the data file
+    - parse_dates: whether to parse the dates
+    - index_col: the index column
+    - chunk_size: if set, read csv files in chunks of this many rows with a compact (float32) schema
+    - cache_dir: if set, read and write the parsed frame from a parquet cache in this directory
+    - columns: the columns to read, all columns if None
+    - excel_streaming: read xlsx files by streaming rows from a read-only workbook instead of pd.read_excel
+    - sheet_name: the sheet of xlsx files to read, or a list of sheets (None for all sheets)
+      read in parallel and combined like partitions
+    - max_workers: the number of processes reading the sheets of a list, all cores if None
+
+    Returns:
+    - data: the parsed data
+    '''
+
+    data = None
+    cached = None
+    if cache_dir is not None:
+        key = cache_key(file_path, parse_dates=parse_dates, index_col=index_col, chunk_size=chunk_size, columns=columns, sheet_name=sheet_name)
+        cached = read_cache(cache_dir, key)
+
+    if cached is not None:
+        data = cached
+    elif file_path.endswith('.csv'):
+        # push the column projection down to the parser
+        usecols, index = get_projection(pd.read_csv(file_path, nrows=0).columns, columns, index_col)
+        if chunk_size:
+            data = read_csv_chunked(file_path, parse_dates=parse_dates, index_col=index, chunk_size=chunk_size, usecols=usecols)
+        else:
+            data = pd.read_csv(file_path, parse_dates=parse_dates, index_col=index, usecols=usecols, na_values=BLANK_NA_VALUES)
+    elif file_path.endswith('.xlsx') and (sheet_name is None or isinstance(sheet_name, list)):
+        sheets = read_excel_sheets(file_path, sheet_name, max_workers=max_workers, parse_dates=parse_dates, index_col=index_col,
+                                   columns=columns, excel_streaming=excel_streaming)
+        data = combine_frames(list(sheets.values()))
+    elif file_path.endswith('.xlsx'):
+        data = read_excel_sheet(file_path, sheet_name=sheet_name, parse_dates=parse_dates, index_col=index_col, columns=columns,
+                                excel_streaming=excel_streaming)
+    elif file_path.endswith('.pickle'):
+        data = pd.read_pickle(file_path)
+        data = data.set_index(data.columns[0])
+        if columns is not None:
+            data = data[[col for col in columns if col in data.columns]]
+        if parse_dates:
+            data.index = pd.to_datetime(data.index)
+
+    if data is not None:
+        # convert blank strings to NaN once, so later stages can skip it
+        data = normalize_blanks(data)
+
+        if cache_dir is not None and cached is None:
+            write_cache(data, cache_dir, key)
+
+    return data
+
+
+def expand_sources(file_path: str) -> list:
+    '''
+    Expand a directory or a glob pattern into the data files it contains
+
+    Parameters:
+    - file_path: a file path, a directory or a glob pattern
+
+    Returns:
+    - file_paths: the sorted data files, [file_path] for a plain file path
+    '''
+
+    if os.path.isdir(file_path):
+        file_paths = glob.glob(os.path.join(file_path, '*'))
+    elif any(char in file_path for char in '*?['):
+        file_paths = glob.glob(file_path)
+    else:
+        return [file_path]
+
+    file_paths = sorted(path for path in file_paths if path.endswith(SUPPORTED_EXTENSIONS))
+    if not file_paths:
+        raise FileNotFoundError(f"No {'/'.join(SUPPORTED_EXTENSIONS)} files found in {file_path}")
+
+    return file_paths
+
+
+def read_partitions(file_paths: list, max_workers: int = None, **options) -> pd.DataFrame:
+    '''
+    Parse several data files in a process pool and combine them into one frame
+
+    The frames are combined with combine_frames, in the sorted order of the files.
+
+    Parameters:
+    - file_paths: the data files, e.g. one csv per day or per unit
+    - max_workers: the number of processes, all cores if None
+    - options: the keyword arguments of read_source
+
+    Returns:
+    - data: the combined data
+    '''
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # the sheets of each file are read in its own worker, one after another
+        frames = list(executor.map(partial(read_source, max_workers=1, **options), file_paths))
+
+    data = combine_frames(frames)
+
+    return normalize_blanks(data)
@@ -0,0 +1,170 @@
+import weakref
+import warnings
+from dataclasses import dataclass
+import pandas as pd
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Data_Exploration.data_loader import BLANKS_NORMALIZED
+from Data_Exploration.numeric_block import get_numeric_block, frame_version, is_current_version
+
+
+# id(frame) -> (profile, frame version), dropped when the frame is garbage collected
+_profile_cache = {}
+
+
+@dataclass
+class DatasetProfile:
+    '''
+    Summary of a DataFrame computed in one vectorized pass
+
+    Attributes:
+    - shape: the shape of the data
+    - dtypes: the dtype of each column
+    - null_counts: the number of NaN/None values of each column
+    - blank_counts: the number of empty or whitespace-only strings of each column
+    - stats: min/max/mean/std of the numeric columns
+    - constant: whether each column holds a single value (NaN included)
+    '''
+    shape: tuple
+    dtypes: pd.Series
+    null_counts: pd.Series
+    blank_counts: pd.Series
+    stats: pd.DataFrame
+    constant: pd.Series
+
+    @property
+    def missing_counts(self) -> pd.Series:
+        '''Number of missing values per column, blank strings counted as missing'''
+        return self.null_counts + self.blank_counts
+
+    @property
+    def missing_fraction(self) -> pd.Series:
+        '''Fraction of missing values per column, blank strings counted as missing'''
+        return self.missing_counts / max(self.shape[0], 1)
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame) -> 'DatasetProfile':
+        '''
+        Profile a DataFrame
+
+        Parameters:
+        - data: the input data
+
+        Returns:
+        - profile: the DatasetProfile of the data
+        '''
+
+        null_counts = pd.Series(0, index=data.columns, dtype='int64')
+        blank_counts = pd.Series(0, index=data.columns, dtype='int64')
+        constant = pd.Series(False, index=data.columns)
+
+        # numeric columns: one float matrix for nulls, stats and constant flags
+        numeric = get_numeric_block(data)
+        values = numeric.matrix
+        nan_mask = np.isnan(values)
+        null_counts[numeric.columns] = nan_mask.sum(axis=0)
+        with warnings.catch_warnings():
+            # all-NaN columns get NaN stats
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            stats = pd.DataFrame({
+                'min': np.nanmin(values, axis=0) if len(values) else np.nan,
+                'max': np.nanmax(values, axis=0) if len(values) else np.nan,
+                'mean': np.nanmean(values, axis=0),
+                'std': np.nanstd(values, axis=0, ddof=1),
+            }, index=numeric.columns)
+        # a column is constant if all its values equal the first one, NaN included
+        if len(values):
+            first = values[0]
+            same = (values == first) | (nan_mask & np.isnan(first))
+            constant[numeric.columns] = same.all(axis=0)
+
+        # remaining columns (object, category, bool, datetime)
+        others = data.drop(columns=numeric.columns)
+        if others.shape[1] > 0:
+            null_counts[others.columns] = others.isnull().sum().to_numpy()
+            constant[others.columns] = (others.nunique(dropna=False) <= 1).to_numpy()
+
+        # blank strings, unless the frame was already normalized at load time
+        if not data.attrs.get(BLANKS_NORMALIZED):
+            for col in data.select_dtypes(include=['object']).columns:
+                try:
+                    blank_counts[col] = data[col].str.fullmatch(r'\s*', na=False).sum()
+                except AttributeError:
+                    # no string values in the column
+                    pass
+            # categoricals: match the categories once, then count their codes
+            for col in data.select_dtypes(include=['category']).columns:
+                cats = data[col].cat.categories
+                blank_codes = np.flatnonzero(cats.astype(str).str.fullmatch(r'\s*'))
+                blank_counts[col] = np.isin(data[col].cat.codes, blank_codes).sum()
+
+        return cls(
+            shape=data.shape,
+            dtypes=data.dtypes,
+            null_counts=null_counts,
+            blank_counts=blank_counts,
+            stats=stats,
+            constant=constant,
+        )
+
+
+def null_mask(data: pd.DataFrame) -> np.ndarray:
+    '''
+    Get the NaN/None mask of a DataFrame, column by column
+
+    Parameters:
+    - data: the input data
+
+    Returns:
+    - mask: a (n_columns, n_rows) boolean array, each column is a contiguous row of the array
+    '''
+
+    mask = np.empty(data.shape[::-1], dtype=bool)
+    numeric = get_numeric_block(data)
+    numeric_pos = set()
+    for i, pos in enumerate(data.columns.get_indexer(numeric.columns)):
+        np.isnan(numeric.values[i], out=mask[pos])
+        numeric_pos.add(pos)
+    for pos in range(data.shape[1]):
+        if pos not in numeric_pos:
+            mask[pos] = data.iloc[:, pos].isnull().to_numpy()
+
+    return mask
+
+
+def get_profile(data: pd.DataFrame) -> DatasetProfile:
+    '''
+    Get the profile of a DataFrame, computing it again only when columns of the frame were
+    assigned, added or dropped (call invalidate_profile after element-wise writes)
+
+    Parameters:
+    - data: the input data
+
+    Returns:
+    - profile: the cached DatasetProfile of the data
+    '''
+
+    key = id(data)
+    cached = _profile_cache.get(key)
+    if cached is not None and is_current_version(data, cached[1]) and cached[0].dtypes.index.equals(data.columns):
+        return cached[0]
+
+    profile = DatasetProfile.from_frame(data)
+    if key not in _profile_cache:
+        weakref.finalize(data, _profile_cache.pop, key, None)
+    _profile_cache[key] = (profile, frame_version(data))
+
+    return profile
+
+
+def invalidate_profile(data: pd.DataFrame):
+    '''
+    Drop the cached profile of a frame, call it after modifying the frame in place
+
+    Parameters:
+    - data: the modified data
+    '''
+
+    _profile_cache.pop(id(data), None)
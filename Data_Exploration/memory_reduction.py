@@ -0,0 +1,110 @@
+import pandas as pd
+import numpy as np
+
+
+def memory_usage(data: pd.DataFrame) -> pd.Series:
+    '''
+    Get the deep memory usage of each column, object strings included
+
+    Parameters:
+    - data: the input data
+
+    Returns:
+    - the number of bytes of each column
+    '''
+
+    return data.memory_usage(index=False, deep=True)
+
+
+def float32_lossless(values: np.ndarray) -> np.ndarray:
+    '''
+    Check which float64 columns survive a round trip through float32 exactly
+
+    Parameters:
+    - values: a 1-d array, or a 2-d array with one column per variable
+
+    Returns:
+    - whether every value (NaN included) is unchanged by the round trip, per column
+    '''
+
+    with np.errstate(over='ignore'):
+        exact = (values.astype(np.float32) == values) | np.isnan(values)
+
+    return exact.all(axis=0)
+
+
+def downcast_dtype(values: pd.Series, downcast_floats: bool = True, max_category_fraction: float = 0.5):
+    '''
+    Get the smallest dtype a column can be stored in without losing information
+
+    Parameters:
+    - values: the column
+    - downcast_floats: whether float64 columns may become float32, only when float32 holds every value exactly
+    - max_category_fraction: object columns with at most this fraction of distinct values become categoricals
+
+    Returns:
+    - the new dtype, None if the column should keep its dtype
+    '''
+
+    dtype = values.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return None
+
+    if pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_extension_array_dtype(dtype):
+        if len(values) == 0:
+            return None
+        low, high = values.min(), values.max()
+        # signed types only, so diffs and gains of the column cannot wrap around
+        for candidate in (np.int8, np.int16, np.int32):
+            info = np.iinfo(candidate)
+            if info.min <= low and high <= info.max:
+                return candidate if candidate != dtype else None
+        return None
+
+    if dtype == np.float64 and downcast_floats:
+        return np.float32 if float32_lossless(values.to_numpy()) else None
+
+    if dtype == object:
+        n_unique = values.nunique()
+        if 0 < n_unique <= max_category_fraction * len(values):
+            return 'category'
+
+    return None
+
+
+def reduce_memory(data: pd.DataFrame, downcast_floats: bool = True, max_category_fraction: float = 0.5) -> tuple[pd.DataFrame, pd.DataFrame]:
+    '''
+    Downcast integer and float columns to the smallest safe dtype and convert
+    low-cardinality object columns to categoricals
+
+    Parameters:
+    - data: the input data
+    - downcast_floats: whether float64 columns may become float32, only when float32 holds every value exactly
+    - max_category_fraction: object columns with at most this fraction of distinct values become categoricals
+
+    Returns:
+    - data: the data with the smaller dtypes
+    - report: the dtype and deep memory (MB) of each changed column before and after
+    '''
+
+    before = memory_usage(data)
+    new_dtypes = {}
+    for col in data.columns:
+        dtype = downcast_dtype(data[col], downcast_floats=downcast_floats, max_category_fraction=max_category_fraction)
+        if dtype is not None:
+            new_dtypes[col] = dtype
+
+    reduced = data.astype(new_dtypes) if new_dtypes else data.copy(deep=False)
+    reduced.attrs = dict(data.attrs)
+    after = memory_usage(reduced)
+
+    changed = list(new_dtypes)
+    report = pd.DataFrame({
+        'dtype before': data.dtypes[changed].astype(str),
+        'dtype after': reduced.dtypes[changed].astype(str),
+        'MB before': before[changed] / 2**20,
+        'MB after': after[changed] / 2**20,
+    }, index=pd.Index(changed, dtype=object))
+    report.loc['Total'] = ['', '', before.sum() / 2**20, after.sum() / 2**20]
+
+    return reduced, report
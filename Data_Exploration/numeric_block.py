@@ -0,0 +1,212 @@
+import os
+import weakref
+import pandas as pd
+import numpy as np
+
+
+# numeric blocks are cached per frame object, with the version of the frame they were built from,
+# and dropped when the frame is garbage collected
+_block_cache = {}
+
+
+def numeric_columns(data: pd.DataFrame) -> pd.Index:
+    '''
+    Get the columns select_dtypes(include=['number']) would select, without copying the data
+
+    Parameters:
+    - data: the input data
+
+    Returns:
+    - the names of the numeric columns
+    '''
+
+    is_numeric = [pd.api.types.is_numeric_dtype(dt) and not pd.api.types.is_bool_dtype(dt) for dt in data.dtypes]
+
+    return data.columns[np.array(is_numeric, dtype=bool)]
+
+
+class NumericBlock:
+    '''
+    The numeric columns of a DataFrame as one contiguous array
+
+    The array is stored column-major as (n_columns, n_rows) in C order, which is
+    the layout pandas uses for its own blocks, so every column is a contiguous
+    1-d view and frames built from the block share its memory.
+
+    Parameters:
+    - values: the (n_columns, n_rows) array, a np.ndarray or np.memmap
+    - columns: the column names
+    - index: the row index
+    '''
+    def __init__(self, values: np.ndarray, columns: pd.Index, index: pd.Index):
+        self.values = values
+        self.columns = pd.Index(columns)
+        self.index = index
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame, dtype=None, memmap_path: str = None, columns: list = None) -> 'NumericBlock':
+        '''
+        Copy the numeric columns of a DataFrame into a NumericBlock
+
+        Parameters:
+        - data: the input data
+        - dtype: the dtype of the block, float32 if all numeric columns are float32, float64 otherwise
+        - memmap_path: if set, back the block with a np.memmap file at this path
+        - columns: the numeric columns to copy, all of them if None
+
+        Returns:
+        - block: the NumericBlock of the numeric columns
+        '''
+
+        numeric_cols = numeric_columns(data) if columns is None else pd.Index(columns)
+        if dtype is None:
+            all_float32 = len(numeric_cols) > 0 and (data.dtypes[numeric_cols] == np.float32).all()
+            dtype = np.float32 if all_float32 else np.float64
+        shape = (len(numeric_cols), data.shape[0])
+
+        if memmap_path is not None:
+            values = np.memmap(memmap_path, dtype=dtype, mode='w+', shape=shape)
+        else:
+            values = np.empty(shape, dtype=dtype)
+        # fill column by column, so no intermediate copy of the whole frame is made
+        for i, col in enumerate(numeric_cols):
+            values[i] = data[col].to_numpy(dtype=dtype, na_value=np.nan)
+
+        return cls(values, numeric_cols, data.index)
+
+    @property
+    def shape(self) -> tuple:
+        '''(n_rows, n_columns), like DataFrame.shape'''
+        return self.values.shape[::-1]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        '''(n_rows, n_columns) view of the block'''
+        return self.values.T
+
+    def column(self, col_name: str) -> np.ndarray:
+        '''
+        Get a column as a contiguous 1-d view
+
+        Parameters:
+        - col_name: the column name
+
+        Returns:
+        - the values of the column, sharing memory with the block
+        '''
+
+        return self.values[self.columns.get_loc(col_name)]
+
+    def to_frame(self, columns: list = None) -> pd.DataFrame:
+        '''
+        Get the block, or some of its columns, as a DataFrame
+
+        The frame shares memory with the block when all columns are selected or the
+        selected columns are adjacent in the block, otherwise the columns are copied.
+
+        Parameters:
+        - columns: the columns to select, all columns if None
+
+        Returns:
+        - data: the DataFrame of the selected columns
+        '''
+
+        if columns is None:
+            block = self
+        else:
+            positions = self.columns.get_indexer(columns)
+            if (positions < 0).any():
+                raise KeyError(f"{list(pd.Index(columns)[positions < 0])} not in the numeric columns")
+            if len(positions) > 0 and (np.diff(positions) == 1).all():
+                # adjacent columns: slice instead of fancy indexing, so no copy is made
+                values = self.values[positions[0]:positions[-1] + 1]
+            else:
+                values = self.values[positions]
+            block = NumericBlock(values, self.columns[positions], self.index)
+
+        data = pd.DataFrame(block.values.T, index=block.index, columns=block.columns, copy=False)
+        # stages calling get_numeric_block on the frame get this block back instead of a copy
+        _cache_block(data, block)
+
+        return data
+
+
+def get_numeric_block(data: pd.DataFrame, dtype=None, memmap_path: str = None) -> NumericBlock:
+    '''
+    Get the NumericBlock of a DataFrame, building it only once per frame
+
+    The cached block is rebuilt when the frame changed since: columns assigned, added or
+    dropped (e.g. data[cols] = ...) replace the arrays of the frame, which the cache checks.
+    Element-wise writes (data.loc[i, col] = ...) keep the arrays, call invalidate_numeric_block
+    after them. Frames built by NumericBlock.to_frame share memory with their block and
+    never go stale.
+
+    Parameters:
+    - data: the input data
+    - dtype: the dtype of the block, see NumericBlock.from_frame
+    - memmap_path: if set, back the block with a np.memmap file at this path, a cached
+      block that is not backed by this file is rebuilt
+
+    Returns:
+    - block: the cached NumericBlock of the data
+    '''
+
+    cached = _block_cache.get(id(data))
+    if cached is not None:
+        block, version = cached
+        if is_current_version(data, version) and (dtype is None or block.values.dtype == dtype) \
+                and (memmap_path is None or _is_memmap_of(block, memmap_path)) \
+                and block.shape[0] == data.shape[0] and block.columns.equals(numeric_columns(data)):
+            return block
+
+    block = NumericBlock.from_frame(data, dtype=dtype, memmap_path=memmap_path)
+    _cache_block(data, block)
+
+    return block
+
+
+def frame_version(data: pd.DataFrame) -> list:
+    '''
+    Get a cheap version of a frame: weak references to the arrays holding its columns,
+    which pandas replaces when columns are assigned, added or dropped
+
+    Parameters:
+    - data: the input data
+
+    Returns:
+    - version: compare it with is_current_version
+    '''
+
+    return [weakref.ref(array) for array in data._mgr.arrays]
+
+
+def is_current_version(data: pd.DataFrame, version: list) -> bool:
+    '''
+    Check that a frame still holds the arrays of a version from frame_version
+    '''
+
+    arrays = data._mgr.arrays
+    return len(arrays) == len(version) and all(ref() is array for ref, array in zip(version, arrays))
+
+
+def _is_memmap_of(block: NumericBlock, memmap_path: str) -> bool:
+    return isinstance(block.values, np.memmap) and block.values.filename is not None \
+        and os.path.abspath(block.values.filename) == os.path.abspath(memmap_path)
+
+
+def _cache_block(data: pd.DataFrame, block: NumericBlock):
+    key = id(data)
+    if key not in _block_cache:
+        weakref.finalize(data, _block_cache.pop, key, None)
+    _block_cache[key] = (block, frame_version(data))
+
+
+def invalidate_numeric_block(data: pd.DataFrame):
+    '''
+    Drop the cached NumericBlock of a frame, call it after element-wise writes to the frame
+
+    Parameters:
+    - data: the modified data
+    '''
+
+    _block_cache.pop(id(data), None)
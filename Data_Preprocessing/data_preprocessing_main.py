@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 from typing import Protocol, List
 import pandas as pd
+import numpy as np
 from sklearn.model_selection import train_test_split
 from category_encoders import TargetEncoder
 from sklearn.preprocessing import OrdinalEncoder, StandardScaler, MinMaxScaler
@@ -10,6 +11,86 @@ with open('./config.yaml') as f:
     cfg = Box.from_yaml(f.read())
 
 
+@dataclass
+class SplitPlan:
+    '''
+    Row positions of the training, validation and test sets, computed once per pipeline run
+    and shared by every fit/transform stage, so the data is never split into copies and
+    concatenated back
+
+    Parameters:
+    - train, val, test: the row positions of each set
+    - n_rows: the number of rows of the planned data
+    '''
+    train: np.ndarray
+    val: np.ndarray
+    test: np.ndarray
+    n_rows: int
+
+    @classmethod
+    def from_data(cls, data: pd.DataFrame) -> 'SplitPlan':
+        '''
+        Plan the split of the data with cfg.data_split, splitting row positions instead of the data
+
+        Parameters:
+        - data: the input DataFrame
+
+        Return:
+        - plan: the split plan of the data
+        '''
+        test_size, other_cfg = cfg.data_split.test_size, cfg.data_split.other_config
+
+        if other_cfg.shuffle is False:
+            if other_cfg.stratify is not None:
+                raise ValueError(
+                    "Stratified train/test split is not implemented for shuffle=False"
+                )
+
+        # stratify names the column holding the class labels
+        options = dict(other_cfg)
+        stratify = options.pop('stratify')
+        stratify = data[stratify].to_numpy() if stratify is not None else None
+
+        positions = np.arange(len(data))
+        train, rest = train_test_split(positions, test_size=test_size*2, stratify=stratify, **options)
+        val, test = train_test_split(rest, test_size=0.5, stratify=stratify[rest] if stratify is not None else None, **options)
+
+        return cls(train, val, test, len(data))
+
+    def rows(self, part: str):
+        '''
+        Get the rows of a set, as a slice when they are contiguous (no shuffle) so that
+        selecting them does not copy the data
+
+        Parameters:
+        - part: train, val or test
+
+        Return:
+        - rows: a slice or an array of row positions
+        '''
+        positions = getattr(self, part)
+        if len(positions) > 0 and positions[-1] - positions[0] == len(positions) - 1 and (np.diff(positions) == 1).all():
+            return slice(positions[0], positions[-1] + 1)
+
+        return positions
+
+    def take(self, data: pd.DataFrame, part: str) -> pd.DataFrame:
+        '''
+        Get one set of the data
+
+        Parameters:
+        - data: the planned DataFrame
+        - part: train, val or test
+
+        Return:
+        - data: the rows of the set
+        '''
+        if len(data) != self.n_rows:
+            raise ValueError(f"The split plan is for {self.n_rows} rows, the data has {len(data)}")
+
+        return data.iloc[self.rows(part)]
+
+
 # can also use ABC instead of Protocol here
 class FeatureEncoding(Protocol):
     def get_columns(self) -> list:
@@ -59,9 +140,12 @@ class BinaryEncoding:
     
 
 class TargetEncoding():
-    def __init__(self, data: pd.DataFrame = None, target_list: List[str] = None):
+    def __init__(self, data: pd.DataFrame = None, target_list: List[str] = None, split_plan: SplitPlan = None):
         self.data = data
         self.target_list = target_list
+        self.split_plan = split_plan
+        # the fitted encoder, set by encode
+        self.encoder = None
 
     def get_columns(self) -> list:
         '''
@@ -89,33 +173,28 @@ class TargetEncoding():
 
         categorical_cols = self.get_columns()
 
-        data_preprocessing = DataPreprocessing()
-        X_train, X_val, X_test, y_train, y_val, y_test = data_preprocessing.data_splitting(self.data, self.target_list)
+        # fit on the training rows, then transform all rows in their original order
+        split_plan = self.split_plan if self.split_plan is not None else SplitPlan.from_data(self.data)
+        train = split_plan.take(self.data, 'train')
 
         encoder = TargetEncoder()
-        encoder.fit(X_train[categorical_cols], y_train)
+        encoder.fit(train[categorical_cols], train[self.target_list])
+        self.encoder = encoder
 
         joblib.dump(encoder, 'temp_save/target_encoder.gz')
 
-        X_train[categorical_cols] = encoder.transform(X_train[categorical_cols])
-        X_val[categorical_cols] = encoder.transform(X_val[categorical_cols])
-        X_test[categorical_cols] = encoder.transform(X_test[categorical_cols])
-
-        # Create DataFrames for training, validation, and test sets
-        df_train = pd.concat([X_train, y_train], axis=1)
-        df_val = pd.concat([X_val, y_val], axis=1)
-        df_test = pd.concat([X_test, y_test], axis=1)
-
-        # Concatenate training, validation, and test sets back to the original DataFrame
-        self.data = pd.concat([df_train, df_val, df_test])
+        self.data[categorical_cols] = encoder.transform(self.data[categorical_cols])
 
         return self.data
 
 
 class OrdinalEncoding():
-    def __init__(self, data: pd.DataFrame = None, target_list: List[str] = None):
+    def __init__(self, data: pd.DataFrame = None, target_list: List[str] = None, split_plan: SplitPlan = None):
         self.data = data
         self.target_list = target_list
+        self.split_plan = split_plan
+        # the fitted encoder, set by encode
+        self.encoder = None
 
     def get_columns(self) -> list:
         '''
@@ -155,31 +234,26 @@ class OrdinalEncoding():
         encoder = OrdinalEncoder()
         col_list = self.get_columns()
 
-        data_preprocessing = DataPreprocessing()
-        X_train, X_val, X_test, y_train, y_val, y_test = data_preprocessing.data_splitting(self.data, self.target_list)
+        # fit on the training rows, then transform all rows in their original order
+        split_plan = self.split_plan if self.split_plan is not None else SplitPlan.from_data(self.data)
+        train = split_plan.take(self.data, 'train')
 
-        encoder.fit(X_train[col_list], y_train)
+        encoder.fit(train[col_list], train[self.target_list])
+        self.encoder = encoder
         joblib.dump(encoder, 'temp_save/ordinal_encoder.gz')
 
-        X_train[col_list] = encoder.transform(X_train[col_list])
-        X_val[col_list] = encoder.transform(X_val[col_list])
-        X_test[col_list] = encoder.transform(X_test[col_list])
-
-        # Create DataFrames for training, validation, and test sets
-        df_train = pd.concat([X_train, y_train], axis=1)
-        df_val = pd.concat([X_val, y_val], axis=1)
-        df_test = pd.concat([X_test, y_test], axis=1)
-
-        # Concatenate training, validation, and test sets back to the original DataFrame
-        self.data = pd.concat([df_train, df_val, df_test])
+        self.data[col_list] = encoder.transform(self.data[col_list])
 
         return self.data
 
 
 class FeatureScaling():
-    def __init__(self, data: pd.DataFrame = None, target_list: List[str] = None):
+    def __init__(self, data: pd.DataFrame = None, target_list: List[str] = None, split_plan: SplitPlan = None):
         self.data = data
         self.target_list = target_list
+        self.split_plan = split_plan
+        # the fitted scaler, set by scale
+        self.scaler = None
 
     def get_columns(self) -> list:
         '''
@@ -189,7 +263,7 @@ class FeatureScaling():
         - numerical_cols: a list of numerical columns
         '''
 
-        numerical_cols = self.data.select_dtypes(include=['int64', 'float64']).columns.tolist()
+        numerical_cols = self.data.select_dtypes(include=['number']).columns.tolist()
         # delete the target column if it is in the list
         for col in self.target_list:
             if col in numerical_cols:
@@ -210,8 +284,7 @@ class FeatureScaling():
 
         numerical_columns = self.get_columns()
 
-        data_preprocessing = DataPreprocessing()
-        X_train, X_val, X_test, y_train, y_val, y_test = data_preprocessing.data_splitting(self.data, target_list=self.target_list)
+        split_plan = self.split_plan if self.split_plan is not None else SplitPlan.from_data(self.data)
 
         if method == "minmax":
             scaler = MinMaxScaler()
@@ -220,20 +293,12 @@ class FeatureScaling():
         else:
             raise ValueError("Invalid method! Choose from: minmax, standard")
 
-        scaler.fit(X_train[numerical_columns])
+        # fit on the training rows, then transform all rows in their original order
+        scaler.fit(split_plan.take(self.data, 'train')[numerical_columns])
+        self.scaler = scaler
         joblib.dump(scaler, f'temp_save/{method}_scaler.gz')
 
-        X_train[numerical_columns] = scaler.transform(X_train[numerical_columns])
-        X_val[numerical_columns] = scaler.transform(X_val[numerical_columns])
-        X_test[numerical_columns] = scaler.transform(X_test[numerical_columns])
-
-        # merge X and y back together
-        X_train[self.target_list] = y_train
-        X_val[self.target_list] = y_val
-        X_test[self.target_list] = y_test
-
-        # merge X_train, X_val, X_test back together
-        self.data = pd.concat([X_train, X_val, X_test])
+        self.data[numerical_columns] = scaler.transform(self.data[numerical_columns])
 
         return self.data
 
@@ -242,6 +307,28 @@ class DataPreprocessing():
     def __init__(self, data: pd.DataFrame = None, target_list: List[str] = None):
         self.data = data
         self.target_list = target_list
+        self.split_plan = None
+        # fitted by feature_encoding and feature_scaling, kept to transform later rows
+        self.binary_cols = []
+        self.encoder = None
+        self.scaler = None
+
+    def get_split_plan(self, data: pd.DataFrame = None) -> SplitPlan:
+        '''
+        Get the split plan of the data, computed once and shared by the encoding and the scaling
+
+        Parameters:
+        - data: the input DataFrame
+
+        Return:
+        - split_plan: the split plan, planned again only if the number of rows changed
+        '''
+
+        data = data if data is not None else self.data
+        if self.split_plan is None or self.split_plan.n_rows != len(data):
+            self.split_plan = SplitPlan.from_data(data)
+
+        return self.split_plan
 
     # using protocol to define the interface
     def feature_encoding(self, data: pd.DataFrame=None, method: FeatureEncoding=TargetEncoding) -> pd.DataFrame:
@@ -259,11 +346,13 @@ class DataPreprocessing():
 
         # binary encoding
         be = BinaryEncoding(data, self.target_list)
+        self.binary_cols = be.get_columns()
         data = be.encode()
         
         method = TargetEncoding if len(self.target_list) == 1 else OrdinalEncoding
-        encoder = method(data, self.target_list)
+        encoder = method(data, self.target_list, self.get_split_plan(data))
         data = encoder.encode()
+        self.encoder = encoder.encoder
         
         return data
 
@@ -280,8 +369,9 @@ class DataPreprocessing():
 
         data = data if data is not None else self.data
 
-        minmax_scaling = FeatureScaling(data, self.target_list)
+        minmax_scaling = FeatureScaling(data, self.target_list, self.get_split_plan(data))
         data = minmax_scaling.scale(method="minmax")
+        self.scaler = minmax_scaling.scaler
 
         return data
 
@@ -324,22 +414,15 @@ class DataPreprocessing():
         Return:
         - X_train, X_val, X_test, y_train, y_val, y_test, as dataframes
         '''
-        test_size, other_cfg = cfg.data_split.test_size, cfg.data_split.other_config
-
-        if other_cfg.shuffle is False:
-            if other_cfg.stratify is not None:
-                raise ValueError(
-                    "Stratified train/test split is not implemented for shuffle=False"
-                )
-            
         data = data if data is not None else self.data
         target_list = target_list if target_list != [] else self.target_list
-        
+        split_plan = self.get_split_plan(data)
+
         X = data.drop(target_list, axis=1)
         y = data[target_list]
 
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size*2, **other_cfg)
-        X_val, X_test, y_val, y_test = train_test_split(X_test, y_test, test_size=0.5, **other_cfg)
+        X_train, X_val, X_test = (split_plan.take(X, part) for part in ('train', 'val', 'test'))
+        y_train, y_val, y_test = (split_plan.take(y, part) for part in ('train', 'val', 'test'))
 
         return X_train, X_val, X_test, y_train, y_val, y_test
 
@@ -0,0 +1,292 @@
+import os
+import glob
+import joblib
+import pandas as pd
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Data_Preprocessing.feature_engineering import FeatureEngineering
+from Data_Cleansing.data_cleansing_main import fill_method_factory
+
+
+class IncrementalState:
+    '''
+    Fitted state of a pipeline run, kept in a run directory so that appended
+    rows can go through cleansing, encoding, scaling and feature engineering
+    without refitting anything on the full history
+
+    Parameters:
+    - run_dir: the directory holding state.gz and the output/ part files
+    '''
+    def __init__(self, run_dir: str = 'temp_save/run'):
+        self.run_dir = run_dir
+        self.target = None
+        self.last_index = None
+        self.load_dtypes = None
+        # cleansing
+        self.seen_row_hashes = None
+        self.clean_columns = None
+        self.fill_method = None
+        self.fill_values = None
+        self.max_gap = None
+        self.last_clean_row = None
+        # encoding & scaling
+        self.binary_cols = []
+        self.encoder = None
+        self.scaler = None
+        self.resample_scale = None
+        # feature selection & engineering
+        self.selected_columns = None
+        self.feature_engineering = {}
+        self.tail = None
+        self.output_dtypes = None
+
+    @property
+    def output_dir(self) -> str:
+        return os.path.join(self.run_dir, 'output')
+
+    def save(self):
+        '''
+        Save the state to <run_dir>/state.gz
+        '''
+
+        os.makedirs(self.run_dir, exist_ok=True)
+        joblib.dump(self.__dict__, os.path.join(self.run_dir, 'state.gz'))
+
+    @classmethod
+    def load(cls, run_dir: str = 'temp_save/run') -> 'IncrementalState':
+        '''
+        Load the state saved by a previous run
+
+        Parameters:
+        - run_dir: the run directory
+
+        Returns:
+        - state: the IncrementalState of the run
+        '''
+
+        state_path = os.path.join(run_dir, 'state.gz')
+        if not os.path.exists(state_path):
+            raise FileNotFoundError(f"No incremental state in {run_dir}, run the full pipeline with incremental.do first")
+        state = cls(run_dir)
+        state.__dict__.update(joblib.load(state_path))
+        state.run_dir = run_dir
+
+        return state
+
+    def record_load(self, data: pd.DataFrame):
+        '''
+        Record the dtypes of the loaded data, after the memory reduction if it ran
+
+        Parameters:
+        - data: the loaded data
+        '''
+
+        self.load_dtypes = data.dtypes
+
+    def record_cleansing(self, data: pd.DataFrame, fill_method: str, fill_values: pd.Series = None, max_gap=None):
+        '''
+        Record the result of handle_missing_values
+
+        Parameters:
+        - data: the data after handling missing values
+        - fill_method: the fill method that was used
+        - fill_values: the per-column values used to fill (mean/median/mode), None for other methods
+        - max_gap: the max gap of the gap-limited fill methods
+        '''
+
+        self.clean_columns = list(data.columns)
+        self.fill_method = fill_method
+        self.fill_values = fill_values
+        self.max_gap = max_gap
+        self.last_clean_row = data.iloc[-1:]
+
+    def record_encoding(self, binary_cols: list, encoder):
+        '''
+        Record the fitted encoding of feature_encoding
+
+        Parameters:
+        - binary_cols: the bool columns mapped to 0/1
+        - encoder: the fitted target or ordinal encoder, None if nothing was encoded
+        '''
+
+        self.binary_cols = list(binary_cols)
+        self.encoder = encoder
+
+    def record_scaling(self, scaler):
+        '''
+        Record the fitted scaler of feature_scaling
+
+        Parameters:
+        - scaler: the fitted scaler
+        '''
+
+        self.scaler = scaler
+
+    def record_features(self, data: pd.DataFrame, options: dict, max_lag: int = 1):
+        '''
+        Record the selected columns and the rows feature engineering needs from the past
+
+        Parameters:
+        - data: the data after feature selection, before feature engineering, a Series is taken as one column
+        - options: the feature_engineering section of the config
+        - max_lag: the max time lag of the lag features
+        '''
+
+        # correlation_selection returns the target column alone
+        if isinstance(data, pd.Series):
+            data = data.to_frame()
+        self.selected_columns = list(data.columns)
+        self.feature_engineering = dict(options, max_lag=max_lag)
+        # one row more than the lags need, for the gain of the lag features
+        self.tail = data.iloc[-(max_lag + 1):].copy()
+        self.last_index = data.index[-1]
+
+    def new_rows(self, data: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Keep only the rows after the last processed one, with the dtypes of the fitted run
+
+        Parameters:
+        - data: the newly loaded data
+
+        Returns:
+        - data: the rows that were not processed yet
+        '''
+
+        if self.last_index is not None:
+            data = data[data.index > self.last_index]
+        if self.load_dtypes is not None:
+            data = data.astype(self.load_dtypes.reindex(data.columns).dropna().to_dict())
+
+        return data
+
+    def fill_missing(self, data: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Apply the cleansing of the fitted run: drop rows with a missing target,
+        keep the fitted columns and fill with the fitted statistics
+
+        Parameters:
+        - data: the new rows
+
+        Returns:
+        - data: the cleansed rows
+        '''
+
+        data = data.dropna(subset=[self.target])
+        data = data.reindex(columns=self.clean_columns)
+        numeric_cols = data.select_dtypes(include=['number']).columns
+
+        if self.fill_values is not None:
+            data = data.fillna(self.fill_values)
+        elif self.fill_method in ('forward', 'interpolate', 'time'):
+            # start from the last row of the previous batch, so gaps at the start of the batch are filled from it
+            filler = fill_method_factory(self.fill_method, max_gap=self.max_gap)
+            combined = pd.concat([self.last_clean_row, data])
+            combined[numeric_cols] = filler.fill_missing(combined[numeric_cols])
+            data = combined.iloc[len(self.last_clean_row):]
+        elif self.fill_method == 'back':
+            filler = fill_method_factory(self.fill_method, max_gap=self.max_gap)
+            data[numeric_cols] = filler.fill_missing(data[numeric_cols])
+
+        self.last_clean_row = data.iloc[-1:] if len(data) > 0 else self.last_clean_row
+
+        return data
+
+    def encode(self, data: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Encode the new rows with the fitted binary mapping and encoder
+
+        Parameters:
+        - data: the cleansed rows
+
+        Returns:
+        - data: the encoded rows
+        '''
+
+        data = data.copy()
+        for col in self.binary_cols:
+            data[col] = data[col].map({True: 1, False: 0})
+        if self.encoder is not None:
+            encoded_cols = list(self.encoder.feature_names_in_)
+            if encoded_cols:
+                data[encoded_cols] = self.encoder.transform(data[encoded_cols])
+
+        return data
+
+    def scale(self, data: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Scale the new rows with the fitted scaler
+
+        Parameters:
+        - data: the encoded rows
+
+        Returns:
+        - data: the scaled rows
+        '''
+
+        if self.scaler is None:
+            return data
+
+        scaled_cols = list(self.scaler.feature_names_in_)
+        data[scaled_cols] = self.scaler.transform(data[scaled_cols])
+
+        return data
+
+    def engineer_features(self, data: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Select the fitted columns and add the engineered features, using the
+        stored tail rows for the lag and gain features of the first new rows
+
+        Parameters:
+        - data: the scaled rows
+
+        Returns:
+        - data: the new rows with engineered features
+        '''
+
+        data = data[self.selected_columns]
+        n_tail = len(self.tail)
+        combined = pd.concat([self.tail, data])
+
+        fe = FeatureEngineering(combined)
+        if self.feature_engineering.get('time_lag'):
+            combined = fe.add_time_lag_features(combined, col_list=[self.target], max_lag=self.feature_engineering['max_lag'])
+        if self.feature_engineering.get('time_features'):
+            combined = fe.add_time_features(combined)
+        if self.feature_engineering.get('gain'):
+            # transform_gain drops the first row, which is a tail row
+            combined = fe.transform_gain(combined)
+            n_tail -= 1
+
+        self.tail = pd.concat([self.tail, data]).iloc[-len(self.tail):]
+        self.last_index = data.index[-1] if len(data) > 0 else self.last_index
+
+        return combined.iloc[n_tail:]
+
+    def append_output(self, data: pd.DataFrame):
+        '''
+        Append processed rows to the stored output as a new parquet part file,
+        with the dtypes of the first part so all parts share one schema
+
+        Parameters:
+        - data: the processed rows, a Series is stored as one column
+        '''
+
+        if isinstance(data, pd.Series):
+            data = data.to_frame()
+        if self.output_dtypes is None:
+            self.output_dtypes = data.dtypes
+        else:
+            data = data.astype(self.output_dtypes.reindex(data.columns).dropna().to_dict())
+        os.makedirs(self.output_dir, exist_ok=True)
+        part = len(glob.glob(os.path.join(self.output_dir, 'part-*.parquet')))
+        data.to_parquet(os.path.join(self.output_dir, f'part-{part:05d}.parquet'))
+
+    def read_output(self) -> pd.DataFrame:
+        '''
+        Read the stored output of all runs
+
+        Returns:
+        - data: the processed data
+        '''
+
+        return pd.read_parquet(self.output_dir)
@@ -0,0 +1,136 @@
+import ast
+import re
+import weakref
+import pandas as pd
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Data_Exploration.numeric_block import frame_version, is_current_version
+
+
+# the functions a KPI equation may call, all applied to whole columns at once
+KPI_FUNCTIONS = {
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'log': np.log,
+    'log10': np.log10,
+    'exp': np.exp,
+    'minimum': np.minimum,
+    'maximum': np.maximum,
+}
+_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.UAdd, ast.USub)
+# column names with spaces, dashes or colons are quoted with backticks, as in DataFrame.eval
+_BACKTICKS = re.compile(r'`([^`]*)`')
+
+# id(frame) -> {expression: (KPI values, frame version)}, dropped when the frame is garbage collected
+_kpi_cache = {}
+
+
+class KPIExpression:
+    '''
+    KPI equation compiled once into a vectorized NumPy expression over DataFrame columns
+
+    The equation may use numbers, column names (quoted with backticks if they are not
+    Python identifiers, e.g. `OXO-5FI696 Augusta`), + - * / // % ** and the functions
+    in KPI_FUNCTIONS. Anything else is rejected when parsing, so the compiled code only
+    runs array arithmetic.
+
+    Parameters:
+    - expression: the KPI equation, e.g. "`OXO-5FI696 Augusta` / (`OXO-5FI635C Augusta` + 1)"
+    '''
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.columns = []
+
+        # backtick-quoted names are replaced with placeholder identifiers before parsing
+        def quote(match):
+            self.columns.append(match.group(1))
+            return f'__col{len(self.columns) - 1}'
+
+        source = _BACKTICKS.sub(quote, expression.strip())
+        try:
+            tree = ast.parse(source, mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"Invalid KPI equation {expression!r}: {e.msg}")
+
+        self.variables = {f'__col{i}': name for i, name in enumerate(self.columns)}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in KPI_FUNCTIONS or node.keywords:
+                    raise ValueError(f"Invalid KPI equation {expression!r}: only the functions {', '.join(KPI_FUNCTIONS)} can be called")
+            elif isinstance(node, ast.Name):
+                if node.id not in self.variables and node.id not in KPI_FUNCTIONS:
+                    self.variables[node.id] = node.id
+            elif isinstance(node, ast.Constant):
+                if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+                    raise ValueError(f"Invalid KPI equation {expression!r}: only numbers can be constants")
+            elif not isinstance(node, (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Load) + _OPERATORS):
+                raise ValueError(f"Invalid KPI equation {expression!r}: {type(node).__name__} is not supported")
+
+        self.columns = list(dict.fromkeys(self.variables.values()))
+        self.code = compile(tree, '<KPI>', 'eval')
+
+    def validate(self, data: pd.DataFrame):
+        '''
+        Check that every column of the equation is in the data and numeric
+
+        Parameters:
+        - data: the input data
+        '''
+
+        missing = [name for name in self.columns if name not in data.columns]
+        if missing:
+            raise KeyError(f"KPI equation {self.expression!r} uses columns not in the data: {', '.join(missing)}")
+        not_numeric = [name for name in self.columns if not pd.api.types.is_numeric_dtype(data[name])]
+        if not_numeric:
+            raise TypeError(f"KPI equation {self.expression!r} uses non-numeric columns: {', '.join(not_numeric)}")
+
+    def evaluate(self, data: pd.DataFrame) -> pd.Series:
+        '''
+        Evaluate the KPI for all rows at once, cached per frame until its columns are reassigned
+
+        Parameters:
+        - data: the input data
+
+        Returns:
+        - kpi: the KPI of each row, inf from a division by zero becomes NaN
+        '''
+
+        cached = _kpi_cache.get(id(data), {}).get(self.expression)
+        if cached is not None and is_current_version(data, cached[1]):
+            return cached[0].copy()
+
+        self.validate(data)
+        namespace = {variable: data[name].to_numpy(dtype=float) for variable, name in self.variables.items()}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = eval(self.code, {'__builtins__': {}, **KPI_FUNCTIONS}, namespace)
+        values = np.broadcast_to(np.asarray(values, dtype=float), (len(data),)).copy()
+        values[np.isinf(values)] = np.nan
+        kpi = pd.Series(values, index=data.index)
+
+        key = id(data)
+        if key not in _kpi_cache:
+            _kpi_cache[key] = {}
+            weakref.finalize(data, _kpi_cache.pop, key, None)
+        _kpi_cache[key][self.expression] = (kpi, frame_version(data))
+
+        return kpi.copy()
+
+
+def add_kpi(data: pd.DataFrame, expression: str, target_name: str) -> pd.DataFrame:
+    '''
+    Add the KPI of an equation to the data as the target column
+
+    Parameters:
+    - data: the input data
+    - expression: the KPI equation, see KPIExpression
+    - target_name: the name of the KPI column, replaced if it already exists
+
+    Returns:
+    - data: the data with the KPI column
+    '''
+
+    data[target_name] = KPIExpression(expression).evaluate(data)
+
+    return data
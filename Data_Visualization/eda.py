@@ -3,6 +3,10 @@ import plotly.graph_objects as go
 import plotly.express as px
 import numpy as np
 from matplotlib import pyplot as plt
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Data_Exploration.dataset_profile import get_profile
 
 class EDA_Visualization:
     def __init__(self, data: pd.DataFrame = None):
@@ -24,10 +28,11 @@ class EDA_Visualization:
             return
         num_cols_one_plot = 40
         num_plots = data.shape[1] // num_cols_one_plot + 1
+        null_counts = get_profile(data).null_counts
         for i in range(num_plots):
             start = i * num_cols_one_plot
             end = min((i+1) * num_cols_one_plot, data.shape[1])
-            missing_counts = data.iloc[:, start:end].isnull().sum()
+            missing_counts = null_counts.iloc[start:end]
             # Create a bar plot of missing values using Plotly
             fig = go.Figure(data=[go.Bar(x=missing_counts.index, y=missing_counts)])
             fig.update_layout(
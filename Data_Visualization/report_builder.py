@@ -0,0 +1,99 @@
+import os
+import time
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+
+def run_job(name: str, func, args: tuple, kwargs: dict) -> tuple[str, float, str]:
+    '''
+    Run one report job and time it, at module level so the process pool can pickle it
+
+    Returns:
+    - name: the artifact name
+    - seconds: the wall time of the job
+    - error: the error message, None if the job succeeded
+    '''
+
+    start = time.perf_counter()
+    try:
+        func(*args, **kwargs)
+        error = None
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+
+    return name, time.perf_counter() - start, error
+
+
+class ReportBuilder:
+    '''
+    Collect the figure and table jobs of a report, then render them all at once in a process pool
+
+    A job is a picklable callable with its arguments, such as a bound method of a figure
+    or a DataFrame (fig.write_html, data.to_excel) or a module-level function. Workers are
+    reused across jobs, so per-process start-up costs (e.g. the image export engine) are
+    paid once per worker instead of once per figure.
+
+    Parameters:
+    - max_workers: the number of processes, one per core if None, 1 renders in the calling process
+    '''
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers
+        self.jobs = []
+
+    def add(self, name: str, func, *args, **kwargs):
+        '''
+        Add a job to the report
+
+        Parameters:
+        - name: the name of the artifact, used in the timings
+        - func: the callable writing the artifact
+        - args, kwargs: the arguments of func
+        '''
+
+        self.jobs.append((name, func, args, kwargs))
+
+    def extend(self, other: 'ReportBuilder', prefix: str = ''):
+        '''
+        Add the jobs of another builder, so several reports are rendered in one pool
+
+        Parameters:
+        - other: the builder whose jobs are added
+        - prefix: added to the names of the jobs, e.g. the report they belong to
+        '''
+
+        self.jobs.extend((prefix + name, func, args, kwargs) for name, func, args, kwargs in other.jobs)
+
+    def render(self, timings_path: str = None) -> pd.DataFrame:
+        '''
+        Render all collected jobs
+
+        Parameters:
+        - timings_path: if set, save the timings as a csv file at this path
+
+        Returns:
+        - timings: the seconds taken by each artifact and the error of the failed ones,
+          a RuntimeError is raised after rendering if any job failed
+        '''
+
+        start = time.perf_counter()
+        if self.max_workers == 1 or len(self.jobs) <= 1:
+            results = [run_job(*job) for job in self.jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(run_job, *job) for job in self.jobs]
+                results = [future.result() for future in futures]
+        self.jobs = []
+
+        timings = pd.DataFrame(results, columns=['artifact', 'seconds', 'error'])
+        print(timings[['artifact', 'seconds']].round(3).to_string(index=False))
+        print("Rendered %d artifacts in %.2f s" % (len(timings), time.perf_counter() - start))
+        if timings_path is not None:
+            os.makedirs(os.path.dirname(timings_path) or '.', exist_ok=True)
+            timings.to_csv(timings_path, index=False)
+
+        # the other artifacts are written, then the failures are raised together
+        failed = timings.dropna(subset=['error'])
+        if len(failed) > 0:
+            raise RuntimeError("Failed to render: " + '; '.join(f'{name} ({error})' for name, error in failed[['artifact', 'error']].itertuples(index=False)))
+
+        return timings
@@ -0,0 +1,133 @@
+import pandas as pd
+import numpy as np
+from abc import ABC, abstractmethod
+
+
+# the max number of rows of an Excel sheet, header included
+EXCEL_MAX_ROWS = 1048576
+
+
+# Strategy Pattern using ABC
+class ReportSink(ABC):
+    '''
+    Writes the tables of a report in one file format
+
+    Parameters:
+    - chunk_size: the number of rows converted at a time, bounds the memory of the split writes
+    '''
+    extension = ''
+
+    def __init__(self, chunk_size: int = 100000):
+        self.chunk_size = chunk_size
+
+    def path(self, base_path: str) -> str:
+        '''Add the file extension of the sink to a path'''
+        return base_path + self.extension
+
+    @abstractmethod
+    def write(self, data: pd.DataFrame, base_path: str, index: bool = True):
+        pass
+
+    @abstractmethod
+    def write_split(self, data: pd.DataFrame, mask: np.ndarray, base_paths: tuple, index: bool = True):
+        '''
+        Write the rows where mask is False to base_paths[0] and the rows where it is True
+        to base_paths[1], in one pass over the data without copying the two parts
+        '''
+        pass
+
+    def chunks(self, data: pd.DataFrame, mask: np.ndarray):
+        for start in range(0, len(data), self.chunk_size):
+            chunk = data.iloc[start:start + self.chunk_size]
+            chunk_mask = mask[start:start + self.chunk_size]
+            yield chunk[~chunk_mask], chunk[chunk_mask]
+
+
+class CsvSink(ReportSink):
+    extension = '.csv'
+
+    def write(self, data: pd.DataFrame, base_path: str, index: bool = True):
+        data.to_csv(self.path(base_path), index=index)
+
+    def write_split(self, data: pd.DataFrame, mask: np.ndarray, base_paths: tuple, index: bool = True):
+        files = [open(self.path(base_path), 'w', newline='') for base_path in base_paths]
+        try:
+            # the header is written once, the chunks are appended below it
+            for f in files:
+                data.iloc[:0].to_csv(f, index=index)
+            for parts in self.chunks(data, mask):
+                for f, part in zip(files, parts):
+                    part.to_csv(f, index=index, header=False)
+        finally:
+            for f in files:
+                f.close()
+
+
+class ParquetSink(ReportSink):
+    extension = '.parquet'
+
+    def write(self, data: pd.DataFrame, base_path: str, index: bool = True):
+        data.to_parquet(self.path(base_path), index=index)
+
+    def write_split(self, data: pd.DataFrame, mask: np.ndarray, base_paths: tuple, index: bool = True):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.Schema.from_pandas(data.iloc[:0], preserve_index=index)
+        writers = [pq.ParquetWriter(self.path(base_path), schema) for base_path in base_paths]
+        try:
+            for parts in self.chunks(data, mask):
+                for writer, part in zip(writers, parts):
+                    writer.write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=index))
+        finally:
+            for writer in writers:
+                writer.close()
+
+
+class XlsxSink(ReportSink):
+    '''
+    Streams rows into write-only workbooks, so memory stays constant with the number of rows.
+    Rows beyond the Excel sheet limit continue on a new sheet.
+    '''
+    extension = '.xlsx'
+
+    def write(self, data: pd.DataFrame, base_path: str, index: bool = True):
+        self.write_split(data, np.zeros(len(data), dtype=bool), (base_path,), index=index)
+
+    def write_split(self, data: pd.DataFrame, mask: np.ndarray, base_paths: tuple, index: bool = True):
+        import openpyxl
+
+        header = ([data.index.name or ''] if index else []) + [str(col) for col in data.columns]
+        workbooks = [openpyxl.Workbook(write_only=True) for _ in base_paths]
+        sheets = [[wb.create_sheet('Sheet1')] for wb in workbooks]
+        n_rows = [0] * len(workbooks)
+        for sheet in sheets:
+            sheet[0].append(header)
+
+        for parts in self.chunks(data, mask):
+            for i, part in enumerate(parts[:len(workbooks)]):
+                values = part.reset_index() if index else part
+                for row in values.itertuples(index=False, name=None):
+                    if n_rows[i] == EXCEL_MAX_ROWS - 1:
+                        sheets[i].append(workbooks[i].create_sheet(f'Sheet{len(sheets[i]) + 1}'))
+                        sheets[i][-1].append(header)
+                        n_rows[i] = 0
+                    # NaN cells are left empty, as in to_excel
+                    sheets[i][-1].append([None if isinstance(v, float) and np.isnan(v) else v for v in row])
+                    n_rows[i] += 1
+
+        for wb, base_path in zip(workbooks, base_paths):
+            wb.save(self.path(base_path))
+
+
+def sink_factory(report_format: str = 'xlsx', chunk_size: int = 100000) -> ReportSink:
+    """Factory Method"""
+    sinks = {
+        "xlsx": XlsxSink,
+        "csv": CsvSink,
+        "parquet": ParquetSink,
+    }
+    if report_format not in sinks:
+        raise ValueError("Invalid report format! Choose from: xlsx, csv, parquet")
+
+    return sinks[report_format](chunk_size)
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import tempfile
+import warnings
+warnings.filterwarnings('ignore')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pandas as pd
+from Data_Exploration.data_exploration_main import DataExploration
+
+# run from the repo root: python benchmarks/excel_loading.py
+FILES = [
+    'data/coyote_data_sample_5.xlsx',
+    'data/coyote_data_sample_100.xlsx',
+    'data/coyote_0731_1000.xlsx',
+]
+
+
+def best_of(func, repeat: int = 3) -> float:
+    '''
+    Time a function
+
+    Parameters:
+    - func: the function to time
+    - repeat: the number of runs
+
+    Returns:
+    - the fastest run in seconds
+    '''
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main():
+    rows = []
+    for file_path in FILES:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            read_excel = best_of(lambda: DataExploration().load_data(file_path))
+            streaming = best_of(lambda: DataExploration().load_data(file_path, excel_streaming=True))
+            # first call writes the parquet cache, the timed calls read it
+            DataExploration().load_data(file_path, excel_streaming=True, cache_dir=cache_dir)
+            cached = best_of(lambda: DataExploration().load_data(file_path, excel_streaming=True, cache_dir=cache_dir))
+        rows.append({
+            'file': os.path.basename(file_path),
+            'pd.read_excel (s)': read_excel,
+            'streaming (s)': streaming,
+            'parquet cache (s)': cached,
+            'speedup streaming': read_excel / streaming,
+            'speedup cache': read_excel / cached,
+        })
+
+    print(pd.DataFrame(rows).set_index('file').round(3).to_string())
+
+
+if __name__ == '__main__':
+    main()
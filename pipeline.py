@@ -5,9 +5,14 @@ with open('config.yaml') as f:
 import warnings
 warnings.filterwarnings('ignore')
 from Data_Exploration.data_exploration_main import DataExploration
+from Data_Exploration.data_loader import write_tag_manifest
+from Data_Exploration.numeric_block import get_numeric_block
 from Data_Cleansing.data_cleansing_main import DataCleansing
+from Data_Cleansing.column_blocks import ColumnBlockExecutor
 from Data_Preprocessing.data_preprocessing_main import DataPreprocessing
 from Data_Preprocessing.feature_engineering import FeatureEngineering
+from Data_Preprocessing.incremental import IncrementalState
+from Data_Preprocessing.kpi import KPIExpression, add_kpi
 from Data_Analyzing.data_analysis_main import DataAnalysis
 from Data_Analyzing.feature_selection import FeatureSelection
 from Data_Visualization.eda import EDA_Visualization
@@ -18,11 +23,36 @@ class DataProcessing:
         self.data_source = data_source
         self.target = target
 
+    def load(self, data_exp: DataExploration, data_source: str) -> pd.DataFrame:
+        manifest_path = cfg.pipeline_options.feature_selection.manifest_path if cfg.pipeline_options.use_manifest == True else None
+        # the KPI is computed after loading, so its input columns are read with the manifest columns
+        kpi_columns = KPIExpression(cfg.pipeline_options.KPI).columns if cfg.pipeline_options.KPI is not None else None
+        return data_exp.load_data(data_source, parse_dates = cfg.pipeline_options.parse_dates, index_col = cfg.pipeline_options.index_col,
+                                  chunk_size = cfg.pipeline_options.chunk_size, cache_dir = cfg.pipeline_options.cache_dir,
+                                  manifest_path = manifest_path, excel_streaming = cfg.pipeline_options.excel_streaming,
+                                  max_workers = cfg.pipeline_options.max_workers, extra_columns = kpi_columns,
+                                  sheet_name = cfg.pipeline_options.sheet_name)
+
     def pipeline(self):
+        incremental = cfg.pipeline_options.incremental.do == True
+        # the fitted state is only kept for runs that later rows are appended to
+        if incremental:
+            state = IncrementalState(cfg.pipeline_options.incremental.run_dir)
+            state.target = self.target
+
         # Data Exploration
         print('Loading Data...')
         data_exp = DataExploration()
-        df = data_exp.load_data(self.data_source, parse_dates = cfg.pipeline_options.parse_dates, index_col = cfg.pipeline_options.index_col)
+        df = self.load(data_exp, self.data_source)
+        if cfg.pipeline_options.memory_reduction.do == True:
+            print('Reducing Memory...')
+            df = data_exp.reduce_memory_usage(df, downcast_floats=cfg.pipeline_options.memory_reduction.downcast_floats,
+                                              max_category_fraction=cfg.pipeline_options.memory_reduction.max_category_fraction)
+        if cfg.pipeline_options.KPI is not None:
+            print('Computing KPI...')
+            df = add_kpi(df, cfg.pipeline_options.KPI, self.target)
+        if incremental:
+            state.record_load(df)
         print('Getting Size...')
 
         data_exp.get_data_size()
@@ -37,36 +67,65 @@ class DataProcessing:
         eda_vis.visualize_missing_data()
         
         # DataCleansing Module
-        data_cleansing = DataCleansing(df)
+        data_cleansing = DataCleansing(df, executor=ColumnBlockExecutor(**cfg.pipeline_options.column_blocks))
         print('Removing Duplicates...')
 
-        df = data_cleansing.remove_duplicates(df)
+        df = data_cleansing.remove_duplicates(df, drop_columns=cfg.pipeline_options.duplicates.drop_columns, keep_columns=[self.target])
+        if incremental:
+            state.seen_row_hashes = data_cleansing.seen_row_hashes
         print('Handling Missing Data...')
 
         df = data_cleansing.handle_missing_values(df, self.target, 
                                                   cfg.pipeline_options.missing_Values.drop_threshold, 
-                                                  cfg.pipeline_options.missing_Values.fill_method)
+                                                  cfg.pipeline_options.missing_Values.fill_method,
+                                                  max_gap=cfg.pipeline_options.missing_Values.max_gap)
+        if incremental:
+            state.record_cleansing(df, data_cleansing.fill_method, data_cleansing.fill_values, cfg.pipeline_options.missing_Values.max_gap)
       
         data_exp.summarize_missing_data(df)
      
         if cfg.pipeline_options.anomaly == True:
             print('Generating Anomaly Report...')
-            data_cleansing.generate_anomaly_report(df, self.target, cfg.pipeline_options.problem_type,cfg.pipeline_options.KPI)
+            if cfg.pipeline_options.anomaly_targets:
+                # the report targets share one correlation matrix
+                targets = [self.target] + [name for name in cfg.pipeline_options.anomaly_targets if name != self.target]
+                data_cleansing.generate_anomaly_reports(df, targets, cfg.pipeline_options.problem_type, {self.target: cfg.pipeline_options.KPI},
+                                                        max_workers=cfg.pipeline_options.report_workers,
+                                                        report_format=cfg.pipeline_options.report_format,
+                                                        data_source=self.data_source, cache_dir=cfg.pipeline_options.cache_dir,
+                                                        **cfg.pipeline_options.anomaly_bounds)
+            else:
+                data_cleansing.generate_anomaly_report(df, self.target, cfg.pipeline_options.problem_type,cfg.pipeline_options.KPI,
+                                                       max_workers=cfg.pipeline_options.report_workers,
+                                                       report_format=cfg.pipeline_options.report_format,
+                                                       data_source=self.data_source, cache_dir=cfg.pipeline_options.cache_dir,
+                                                       **cfg.pipeline_options.anomaly_bounds)
         if cfg.pipeline_options.outliers == True:
             print('Detecting Outliers...')
-            for i in range(1,len(df.select_dtypes(include=['number']).columns)):
-                data_cleansing.detect_outliers(df.select_dtypes(include=['number']), col_name=df.select_dtypes(include=['number']).columns[i], threshold=3)
+            numeric_df = get_numeric_block(df, memmap_path=cfg.pipeline_options.memmap_path).to_frame()
+            outlier_options = cfg.pipeline_options.outlier_detection
+            if outlier_options.method == 'zscore':
+                data_cleansing.detect_outliers_matrix(numeric_df, columns=numeric_df.columns[1:], threshold=outlier_options.threshold)
+            else:
+                data_cleansing.detect_outliers_rolling(numeric_df, window=outlier_options.window, method=outlier_options.method,
+                                                       threshold=outlier_options.threshold, columns=numeric_df.columns[1:])
  
         # Encoding & Scaling
         dp = DataPreprocessing(df, [self.target])
         print('Encoding Features...')
         df = dp.feature_encoding()
+        if incremental:
+            state.record_encoding(dp.binary_cols, dp.encoder)
       
         if cfg.pipeline_options.scaling == True: 
             print('Scaling Features...')
             df = dp.feature_scaling(df)
+            if incremental:
+                state.record_scaling(dp.scaler)
         if cfg.pipeline_options.resample == True:
             df = dp.data_resampling(df, cfg.pipeline_options.time_scale)
+            if incremental:
+                state.resample_scale = cfg.pipeline_options.time_scale
         
         # Analysis 
         da = DataAnalysis(df,self.target)
@@ -97,8 +156,13 @@ class DataProcessing:
                     threshold = cfg.pipeline_options.feature_selection.threshold
                 )
                 print("selected features: ", selected_tags)
+                selected_tags = list(selected_tags.index)
+            # save the selected tags, so later runs can skip parsing the other columns
+            write_tag_manifest(cfg.pipeline_options.feature_selection.manifest_path, self.target, selected_tags)
 
         # Feature Engineering
+        if incremental:
+            state.record_features(df, cfg.pipeline_options.feature_engineering.to_dict(), max_lag=1)
         fe = FeatureEngineering(df)
         if cfg.pipeline_options.feature_engineering.time_lag == True:
             print('Adding Time Lag Features...')
@@ -110,4 +174,60 @@ class DataProcessing:
             print('Transform the data into gain...')
             df = fe.transform_gain(df)
 
+        if incremental:
+            # keep the fitted state and the output, so new rows can be appended without a full rerun
+            print('Saving Incremental State...')
+            state.append_output(df)
+            state.save()
+
+        return df
+
+    def append(self, data_source: str = None) -> pd.DataFrame:
+        '''
+        Process only the rows of data_source that come after the last processed row,
+        using the fitted state of the last pipeline run, and append them to the stored output
+
+        Reporting stages (anomaly report, outliers, analysis) and feature selection
+        are not rerun. Resampling buckets are formed from the new rows alone.
+
+        Parameters:
+        - data_source: the path of the data with the appended rows, self.data_source if None
+
+        Returns:
+        - df: the processed new rows
+        '''
+
+        state = IncrementalState.load(cfg.pipeline_options.incremental.run_dir)
+
+        print('Loading Data...')
+        df = self.load(DataExploration(), data_source or self.data_source)
+        df = state.new_rows(df)
+        if cfg.pipeline_options.KPI is not None:
+            df = add_kpi(df, cfg.pipeline_options.KPI, self.target)
+        print('# new rows:', len(df))
+        if len(df) == 0:
+            return df
+
+        print('Removing Duplicates...')
+        data_cleansing = DataCleansing(df)
+        # rows repeating a row of an earlier run are dropped too
+        if state.seen_row_hashes is not None:
+            data_cleansing.seen_row_hashes = state.seen_row_hashes
+        df = data_cleansing.remove_duplicates(df)
+        state.seen_row_hashes = data_cleansing.seen_row_hashes
+        print('Handling Missing Data...')
+        df = state.fill_missing(df)
+        print('Encoding Features...')
+        df = state.encode(df)
+        if state.scaler is not None:
+            print('Scaling Features...')
+            df = state.scale(df)
+        if state.resample_scale is not None:
+            df = DataPreprocessing(df, [self.target]).data_resampling(df, state.resample_scale)
+        print('Adding Features...')
+        df = state.engineer_features(df)
+
+        state.append_output(df)
+        state.save()
+
         return df